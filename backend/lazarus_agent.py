@@ -1,14 +1,27 @@
 import os
 import json
+import hashlib
 import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import random
 import ast
+import binascii
 import logging
+import threading
 import traceback as tb_module
+from concurrent.futures import ThreadPoolExecutor
 from simple_env import load_env
+from ttl_cache import TTLCache
+from scan_cache import (
+    make_key, get_cached_scan, put_cached_scan, get_cached_file, put_cached_file,
+    get_cached_llm, put_cached_llm,
+)
 from prompts import (
     get_code_generation_prompt,
+    split_prompt_files,
     get_lightweight_plan_prompt,
     get_batch_code_generation_prompt,
     extract_batch_summary,
@@ -22,22 +35,30 @@ from resurrection_memory import (
 
 class GeminiAPIError(Exception):
     """Raised when all Gemini API models fail after retries."""
-    def __init__(self, message, models_tried=None, last_status=None):
+    def __init__(self, message, models_tried=None, last_status=None, retry_after=None):
         super().__init__(message)
         self.models_tried = models_tried or []
         self.last_status = last_status
+        self.retry_after = retry_after  # Seconds from the last 429's Retry-After header, if any
 
 # Setup logger for lazarus_agent module
 logger = logging.getLogger('lazarus.agent')
 
 # Debug log bridge - imports from main.py at runtime to avoid circular imports
+# Set by main.py to its add_debug_log; None when running standalone
+_debug_log_sink = None
+
+
+def set_debug_log_sink(sink):
+    """Route _add_debug_log entries to the server's debug-log buffer."""
+    global _debug_log_sink
+    _debug_log_sink = sink
+
+
 def _add_debug_log(level, category, message, details=None):
     """Add debug log entry - bridges to main.py's buffer."""
-    try:
-        from main import add_debug_log
-        add_debug_log(level, category, message, details)
-    except ImportError:
-        pass  # Running standalone, skip
+    if _debug_log_sink is not None:
+        _debug_log_sink(level, category, message, details)
 
 # Try to import E2B, handle failure
 try:
@@ -52,6 +73,124 @@ load_env()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 E2B_API_KEY = os.getenv("E2B_API_KEY")
 
+# owner/repo from a GitHub URL, compiled once for every API path
+GITHUB_URL_RE = re.compile(r"github\.com/([^/]+)/([^/.]+)")
+
+# Shared HTTP session: keep-alive connection pool for GitHub and Gemini calls.
+# urllib3 only retries idempotent methods, so Gemini POSTs keep their own retry loop;
+# raise_on_status=False hands the final 5xx back to callers that inspect status codes.
+# 429 is not retried here: urllib3 would sleep for an uncapped Retry-After inside a
+# handler thread, so callers see it at once and apply their own bounded backoff.
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504],
+                      raise_on_status=False),
+))
+
+# Scan results ({path: blob_sha}) keyed on (repo_url, token) so /api/scan and /api/analyze
+# for the same repo don't re-list the tree within a minute. The entry's etag is
+# "branch@commit_sha"; once stale it is revalidated against the branch HEAD instead
+# of re-listing the whole tree.
+SCAN_CACHE = TTLCache(maxsize=256, ttl=60)
+
+# Raw recursive tree listings keyed on (owner, repo, commit_sha, token). A commit SHA
+# names an immutable tree, so the deep scan can reuse the listing /api/scan fetched.
+# (Entries keyed by a branch name, used only when the HEAD lookup fails, expire with the TTL.)
+TREE_CACHE = TTLCache(maxsize=32, ttl=600)
+_TREE_FETCH_LOCKS = {}
+_TREE_FETCH_GUARD = threading.Lock()
+
+# {path: blob_sha} from the last tree listing, keyed on (owner, repo, token); lets
+# /api/file-content serve unchanged files by blob SHA without calling GitHub
+BLOB_SHA_CACHE = TTLCache(maxsize=64, ttl=300)
+
+# Max concurrent blob uploads when creating a PR (GitHub throttles content-creating
+# requests harder than reads, so this stays below the fetch fan-out)
+PR_BLOB_WORKERS = 8
+
+# Files up to this many characters are sent inline in the create-tree request instead
+# of through one POST /git/blobs each, until the inline total reaches the second cap
+PR_INLINE_TREE_MAX_FILE = 100_000
+PR_INLINE_TREE_MAX_TOTAL = 5_000_000
+
+# create-pr runs that fail on a transient GitHub error are re-run (see commit_all_files)
+PR_RETRY_ATTEMPTS = 3
+PR_RETRY_BACKOFF = 0.3
+
+# Seconds to wait for one POST /git/blobs (a timeout counts as a transient failure)
+PR_BLOB_TIMEOUT = 60
+
+
+def git_blob_sha(content: str) -> str:
+    """The SHA-1 git assigns to a blob holding content (UTF-8), without asking GitHub."""
+    data = content.encode('utf-8', 'surrogatepass')
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def _is_transient_status(status_code: int) -> bool:
+    """GitHub statuses worth retrying: rate limiting and server-side errors."""
+    return status_code == 429 or status_code >= 500
+
+
+# Max concurrent GitHub file fetches during a deep scan (kept under GitHub's secondary rate limit)
+DEEP_SCAN_FETCH_WORKERS = 16
+
+# Max concurrent file writes when uploading generated code to the sandbox
+SANDBOX_UPLOAD_WORKERS = 8
+
+# Generated files are written relative to this directory in the sandbox
+SANDBOX_HOME = "/home/user/"
+
+# The directory-grouping fallback packs neighbouring small directories into one batch
+# up to these limits. The model echoes every file of a batch back, so the char cap
+# stays well under one response (65,536 output tokens), not the input window.
+BATCH_PACK_MAX_CHARS = 120_000
+BATCH_PACK_MAX_FILES = 10
+
+# Python crash indicators in a sandbox app.log, matched in one pass with a precompiled alternation
+CRASH_INDICATORS = ("SyntaxError", "ImportError", "ModuleNotFoundError",
+                    "NameError", "IndentationError", "AttributeError: module")
+_CRASH_INDICATOR_RE = re.compile("|".join(re.escape(s) for s in CRASH_INDICATORS))
+_CODE_ERROR_RE = re.compile(r"SyntaxError|ImportError|ModuleNotFoundError")
+
+# Source locations in tracebacks, used to regenerate only the files an error blames
+_PY_TRACEBACK_FILE_RE = re.compile(r'File "(.+?)", line')
+_NODE_STACK_FILE_RE = re.compile(r'at .+ \((.+?):\d+(?::\d+)?\)')
+
+# Deep-scan extractors (run once per fetched file)
+_FLASK_ENDPOINT_RE = re.compile(r'@app\.(get|post|put|delete|patch)\([\'"]([^\'"]+)[\'"]')
+_EXPRESS_ENDPOINT_RE = re.compile(r'(?:app|router)\.(get|post|put|delete|patch|options)\s*\(\s*[\'"]([^\'"]+)[\'"]')
+_ENV_ASSIGN_RE = re.compile(r'([A-Z_][A-Z0-9_]+)\s*=')
+
+# <file path="..."> response parsing (run per Gemini response, strategy 4 per line)
+_FENCE_OPEN_RE = re.compile(r'^```\w*\n')
+_FENCE_CLOSE_RE = re.compile(r'\n```\s*$')
+_FILE_TAG_RE = re.compile(r'<file\s+path="(.*?)">(.*?)</file>', re.DOTALL)
+_FILE_TAG_QUOTED_RE = re.compile(r"<file\s+path=['\"]([^'\"]+)['\"]>(.*?)</file>", re.DOTALL)
+_FILE_TAG_SPACED_RE = re.compile(r'<file\s+path\s*=\s*"([^"]+)"\s*>(.*?)</file\s*>', re.DOTALL)
+_FILE_OPEN_TAG_RE = re.compile(r'<file\s+path\s*=\s*["\']([^"\']+)["\']')
+_FILE_OPEN_TAG_FULL_RE = re.compile(r'<file\s+path\s*=\s*["\'][^"\']+["\']>\s*')
+_PREVIEW_URL_RE = re.compile(r"\[PREVIEW_URL\] (https://[^\s]+)")
+
+def decode_github_base64(b64_content: str, errors: str = 'ignore') -> str:
+    """
+    Decode a GitHub API base64 'content' field to text.
+    GitHub wraps the payload every 60 chars; stripping the newlines once lets the
+    C decoder run in a single pass, followed by one UTF-8 decode.
+    """
+    return binascii.a2b_base64(b64_content.replace("\n", "")).decode('utf-8', errors=errors)
+
+def _decode_github_base64_exact(b64_content: str) -> tuple:
+    """(text, exact): a strict UTF-8 decode, else the lossy one with exact=False."""
+    try:
+        return decode_github_base64(b64_content, errors='strict'), True
+    except UnicodeDecodeError:
+        return decode_github_base64(b64_content), False
+
 def sanitize_path(path: str) -> str:
     """
     Sanitizes file paths to be safe for bash shell commands.
@@ -145,7 +284,7 @@ class LazarusEngine:
 
         try:
             # Parse owner/repo
-            match = re.search(r"github\.com/([^/]+)/([^/.]+)", repo_url)
+            match = GITHUB_URL_RE.search(repo_url)
             if not match:
                 return {"status": "error", "message": "Invalid GitHub URL."}
             
@@ -158,18 +297,18 @@ class LazarusEngine:
             target_branch = "lazarus-resurrection"
 
             # 1. Check if target branch exists
-            branch_resp = requests.get(f"{base_api}/git/ref/heads/{target_branch}", headers=headers)
+            branch_resp = HTTP_SESSION.get(f"{base_api}/git/ref/heads/{target_branch}", headers=headers)
             
             if branch_resp.status_code == 404:
                 # Branch doesn't exist, create it from main
                 print(f"[*] Branch {target_branch} not found. Creating from main...")
-                main_resp = requests.get(f"{base_api}/git/ref/heads/main", headers=headers)
+                main_resp = HTTP_SESSION.get(f"{base_api}/git/ref/heads/main", headers=headers)
                 if main_resp.status_code != 200:
                     return {"status": "error", "message": "Could not find main branch to fork from."}
                 
                 main_sha = main_resp.json()['object']['sha']
                 
-                create_resp = requests.post(
+                create_resp = HTTP_SESSION.post(
                     f"{base_api}/git/refs",
                     headers=headers,
                     json={"ref": f"refs/heads/{target_branch}", "sha": main_sha}
@@ -183,7 +322,7 @@ class LazarusEngine:
             # 2. Get file SHA in target branch (if exists) for update
             file_api = f"{base_api}/contents/{filename}?ref={target_branch}"
             sha = None
-            file_resp = requests.get(file_api, headers=headers)
+            file_resp = HTTP_SESSION.get(file_api, headers=headers)
             if file_resp.status_code == 200:
                 sha = file_resp.json().get('sha')
 
@@ -200,14 +339,14 @@ class LazarusEngine:
             if sha:
                 data["sha"] = sha
 
-            put_resp = requests.put(f"{base_api}/contents/{filename}", headers=headers, json=data)
+            put_resp = HTTP_SESSION.put(f"{base_api}/contents/{filename}", headers=headers, json=data)
             
             if put_resp.status_code in [200, 201]:
                 # 4. Create Pull Request
                 print(f"[*] File committed. Creating Pull Request...")
                 
                 # Check if PR already exists
-                pr_check_resp = requests.get(
+                pr_check_resp = HTTP_SESSION.get(
                     f"{base_api}/pulls",
                     headers=headers,
                     params={"head": f"{owner}:{target_branch}", "base": "main", "state": "open"}
@@ -230,7 +369,7 @@ class LazarusEngine:
                     "base": "main"
                 }
                 
-                pr_resp = requests.post(f"{base_api}/pulls", headers=headers, json=pr_data)
+                pr_resp = HTTP_SESSION.post(f"{base_api}/pulls", headers=headers, json=pr_data)
                 
                 if pr_resp.status_code == 201:
                     pr_url = pr_resp.json()['html_url']
@@ -265,15 +404,15 @@ class LazarusEngine:
         """
         Commits ALL files to a 'lazarus-resurrection' branch and creates a PR.
         files: list of {"filename": str, "content": str}
+        Entries tagged "kept" (copied from the repo for the sandbox only) are skipped.
         """
+        files = [f for f in files if not f.get('kept')]
         if not self.github_token:
             return {"status": "error", "message": "GITHUB_TOKEN is missing."}
 
         try:
-            import base64
-            
             # Parse owner/repo
-            match = re.search(r"github\.com/([^/]+)/([^/.]+)", repo_url)
+            match = GITHUB_URL_RE.search(repo_url)
             if not match:
                 return {"status": "error", "message": "Invalid GitHub URL."}
             
@@ -289,9 +428,9 @@ class LazarusEngine:
 
             # 1. Get the base branch (try main, then master)
             base_branch = "main"
-            main_resp = requests.get(f"{base_api}/git/ref/heads/main", headers=headers)
+            main_resp = HTTP_SESSION.get(f"{base_api}/git/ref/heads/main", headers=headers)
             if main_resp.status_code != 200:
-                main_resp = requests.get(f"{base_api}/git/ref/heads/master", headers=headers)
+                main_resp = HTTP_SESSION.get(f"{base_api}/git/ref/heads/master", headers=headers)
                 base_branch = "master"
                 if main_resp.status_code != 200:
                     return {"status": "error", "message": "Could not find main or master branch."}
@@ -299,71 +438,120 @@ class LazarusEngine:
             base_sha = main_resp.json()['object']['sha']
 
             # 2. Create or update the target branch
-            branch_resp = requests.get(f"{base_api}/git/ref/heads/{target_branch}", headers=headers)
+            branch_resp = HTTP_SESSION.get(f"{base_api}/git/ref/heads/{target_branch}", headers=headers)
             
             if branch_resp.status_code == 404:
                 print(f"[*] Creating branch '{target_branch}'...")
-                create_resp = requests.post(
+                create_resp = HTTP_SESSION.post(
                     f"{base_api}/git/refs",
                     headers=headers,
                     json={"ref": f"refs/heads/{target_branch}", "sha": base_sha}
                 )
                 if create_resp.status_code != 201:
-                    return {"status": "error", "message": f"Failed to create branch: {create_resp.text}"}
+                    return {"status": "error", "message": f"Failed to create branch: {create_resp.text}",
+                            "transient": _is_transient_status(create_resp.status_code)}
             else:
                 # Update existing branch to latest base
                 print(f"[*] Updating branch '{target_branch}'...")
-                requests.patch(
+                HTTP_SESSION.patch(
                     f"{base_api}/git/refs/heads/{target_branch}",
                     headers=headers,
                     json={"sha": base_sha, "force": True}
                 )
 
             # 3. Get the base tree
-            base_commit_resp = requests.get(f"{base_api}/git/commits/{base_sha}", headers=headers)
+            base_commit_resp = HTTP_SESSION.get(f"{base_api}/git/commits/{base_sha}", headers=headers)
             base_tree_sha = base_commit_resp.json()['tree']['sha']
 
-            # 4. Create blobs for each file
-            tree_items = []
-            for f in files:
-                content_bytes = f['content'].encode('utf-8')
-                base64_content = base64.b64encode(content_bytes).decode('utf-8')
-                
-                blob_resp = requests.post(
+            # 4. Stage each file. Small files go inline in the tree request (GitHub writes
+            # the blob itself), so a typical PR needs no per-file calls at all; the rest
+            # are uploaded as blobs concurrently (map() keeps file order).
+            # Generated files are text, so they go up as utf-8: no base64 copy of
+            # each file in memory and a third less data on the wire
+            inline_budget = PR_INLINE_TREE_MAX_TOTAL
+
+            def stage_inline(f):
+                nonlocal inline_budget
+                size = len(f['content'])
+                if size > PR_INLINE_TREE_MAX_FILE or size > inline_budget:
+                    return False
+                inline_budget -= size
+                return True
+
+            # Files whose git blob SHA matches the base branch are already in base_tree
+            # (usually cached from the deep scan), so they need neither a blob nor a tree entry
+            tree_status, base_listing = self._get_tree(owner, repo_name, base_sha, headers)
+            if tree_status == 200 and base_listing:
+                base_blobs = {e['path']: e['sha'] for e in base_listing.get('tree', []) if e.get('type') == 'blob'}
+                changed = [f for f in files
+                           if base_blobs.get(f['filename']) is None
+                           or base_blobs[f['filename']] != git_blob_sha(f['content'])]
+                if len(changed) < len(files):
+                    print(f"[*] {len(files) - len(changed)} file(s) unchanged from {base_branch}, not re-sent")
+                if not changed:
+                    return {"status": "error", "message": f"Nothing to commit: every file matches {base_branch}."}
+            else:
+                changed = files
+
+            inline = [stage_inline(f) for f in changed]
+
+            def stage_file(f, is_inline):
+                """Returns (tree item, None), or (None, HTTP status) if the blob was refused."""
+                if is_inline:
+                    return {"path": f['filename'], "mode": "100644", "type": "blob", "content": f['content']}, None
+                blob_resp = HTTP_SESSION.post(
                     f"{base_api}/git/blobs",
                     headers=headers,
-                    json={"content": base64_content, "encoding": "base64"}
+                    json={"content": f['content'], "encoding": "utf-8"},
+                    timeout=PR_BLOB_TIMEOUT,
                 )
                 
                 if blob_resp.status_code == 201:
-                    blob_sha = blob_resp.json()['sha']
-                    tree_items.append({
+                    print(f"  [+] Staged: {f['filename']}")
+                    return {
                         "path": f['filename'],
                         "mode": "100644",
                         "type": "blob",
-                        "sha": blob_sha
-                    })
-                    print(f"  [+] Staged: {f['filename']}")
-                else:
-                    print(f"  [!] Failed to create blob for {f['filename']}")
+                        "sha": blob_resp.json()['sha']
+                    }, None
+                print(f"  [!] Failed to create blob for {f['filename']}: HTTP {blob_resp.status_code}")
+                return None, blob_resp.status_code
+
+            if all(inline):
+                staged = [stage_file(f, True) for f in changed]
+            else:
+                with ThreadPoolExecutor(max_workers=PR_BLOB_WORKERS) as pool:
+                    staged = list(pool.map(stage_file, changed, inline))
+            print(f"[*] Staged {sum(inline)} file(s) inline, {len(changed) - sum(inline)} as blobs")
+
+            # A missing blob would silently drop the file from the PR, so it fails the run
+            # (and commit_all_files re-runs it if every refusal was a 429/5xx)
+            failed = [(f['filename'], status) for f, (_, status) in zip(changed, staged) if status is not None]
+            if failed:
+                return {"status": "error",
+                        "message": f"Failed to upload {len(failed)} file(s): "
+                                   + ", ".join(f"{name} (HTTP {status})" for name, status in failed[:5]),
+                        "transient": all(_is_transient_status(status) for _, status in failed)}
+            tree_items = [item for item, _ in staged]
 
             if not tree_items:
                 return {"status": "error", "message": "No files were staged."}
 
             # 5. Create a new tree
-            tree_resp = requests.post(
+            tree_resp = HTTP_SESSION.post(
                 f"{base_api}/git/trees",
                 headers=headers,
                 json={"base_tree": base_tree_sha, "tree": tree_items}
             )
             
             if tree_resp.status_code != 201:
-                return {"status": "error", "message": f"Failed to create tree: {tree_resp.text}"}
+                return {"status": "error", "message": f"Failed to create tree: {tree_resp.text}",
+                        "transient": _is_transient_status(tree_resp.status_code)}
             
             new_tree_sha = tree_resp.json()['sha']
 
             # 6. Create a commit
-            commit_resp = requests.post(
+            commit_resp = HTTP_SESSION.post(
                 f"{base_api}/git/commits",
                 headers=headers,
                 json={
@@ -374,23 +562,25 @@ class LazarusEngine:
             )
             
             if commit_resp.status_code != 201:
-                return {"status": "error", "message": f"Failed to create commit: {commit_resp.text}"}
+                return {"status": "error", "message": f"Failed to create commit: {commit_resp.text}",
+                        "transient": _is_transient_status(commit_resp.status_code)}
             
             new_commit_sha = commit_resp.json()['sha']
             print(f"[*] Created commit: {new_commit_sha[:7]}")
 
             # 7. Update the branch reference
-            update_resp = requests.patch(
+            update_resp = HTTP_SESSION.patch(
                 f"{base_api}/git/refs/heads/{target_branch}",
                 headers=headers,
                 json={"sha": new_commit_sha}
             )
             
             if update_resp.status_code != 200:
-                return {"status": "error", "message": f"Failed to update branch: {update_resp.text}"}
+                return {"status": "error", "message": f"Failed to update branch: {update_resp.text}",
+                        "transient": _is_transient_status(update_resp.status_code)}
 
             # 8. Check if PR already exists
-            pr_check_resp = requests.get(
+            pr_check_resp = HTTP_SESSION.get(
                 f"{base_api}/pulls",
                 headers=headers,
                 params={"head": f"{owner}:{target_branch}", "base": base_branch, "state": "open"}
@@ -405,6 +595,7 @@ class LazarusEngine:
                 }
 
             # 9. Create new PR
+            changed_list = "\n".join(f"- `{f['filename']}`" for f in files[:20])
             pr_data = {
                 "title": "🧬 Lazarus Resurrection - Modernized Codebase",
                 "body": f"""## 🦾 Automated Resurrection by Lazarus Engine
@@ -412,7 +603,7 @@ class LazarusEngine:
 This PR contains the **completely modernized** version of your legacy codebase.
 
 ### 📁 Files Changed ({len(files)} files)
-{chr(10).join([f"- `{f['filename']}`" for f in files[:20]])}
+{changed_list}
 {"..." if len(files) > 20 else ""}
 
 ### ✨ What's Included
@@ -428,7 +619,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
                 "base": base_branch
             }
             
-            pr_resp = requests.post(f"{base_api}/pulls", headers=headers, json=pr_data)
+            pr_resp = HTTP_SESSION.post(f"{base_api}/pulls", headers=headers, json=pr_data)
             
             if pr_resp.status_code == 201:
                 pr_url = pr_resp.json()['html_url']
@@ -447,6 +638,10 @@ This PR contains the **completely modernized** version of your legacy codebase.
                     "message": f"Files committed. Create PR manually: {pr_resp.text[:100]}"
                 }
 
+        except requests.RequestException as e:
+            # Dropped connection / timeout partway through: safe to run the whole flow again
+            print(f"[!] PR Creation Error: {str(e)}")
+            return {"status": "error", "message": str(e), "transient": True}
         except Exception as e:
             print(f"[!] PR Creation Error: {str(e)}")
             return {"status": "error", "message": str(e)}
@@ -455,43 +650,63 @@ This PR contains the **completely modernized** version of your legacy codebase.
         """ Fetches the file tree of the remote repository using GitHub API. """
         try:
             # Parse owner/repo
-            match = re.search(r"github\.com/([^/]+)/([^/.]+)", repo_url)
+            match = GITHUB_URL_RE.search(repo_url)
             if not match:
                 return ["(Invalid URL - Simulating Scan)"]
             
             owner, repo_name = match.groups()
             
-            # Try both 'main' and 'master' branches
-            branches = ['main', 'master']
+            cache_key = (repo_url, self.github_token)
+            blob_key = (owner.lower(), repo_name.lower(), self.github_token)
+            entry = SCAN_CACHE.get_entry(cache_key)
+            if entry and entry.fresh:
+                print(f"[*] Scan cache hit: {len(entry.value)} files")
+                return list(entry.value)
             
             headers = {"Accept": "application/vnd.github.v3+json"}
             if self.github_token:
                 headers["Authorization"] = f"token {self.github_token}"
             
+            if entry and entry.etag:
+                # Stale entry: one 40-byte HEAD lookup decides whether the cached
+                # tree (recorded as "branch@sha") is still current
+                branch, _, sha = entry.etag.partition('@')
+                if self._resolve_head_sha(owner, repo_name, branch, headers) == sha:
+                    SCAN_CACHE.touch(cache_key)
+                    BLOB_SHA_CACHE.set(blob_key, entry.value)
+                    print(f"[*] Scan cache revalidated at {sha[:7]}: {len(entry.value)} files")
+                    return list(entry.value)
+            
+            # Every path comes from one recursive trees call per candidate branch:
+            # 'main', then 'master', then (None) the repo's default branch - looked up
+            # only when neither common name exists
+            branches = ['main', 'master', None]
+            
             for branch in branches:
-                api_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/trees/{branch}?recursive=1"
+                if branch is None:
+                    repo_resp = HTTP_SESSION.get(f"https://api.github.com/repos/{owner}/{repo_name}",
+                                                 headers=headers, timeout=30)
+                    if repo_resp.status_code != 200:
+                        break
+                    branch = repo_resp.json().get('default_branch', 'main')
+                    if branch in ('main', 'master'):
+                        break  # Already tried
                 
-                resp = requests.get(api_url, headers=headers, timeout=30)
-                if resp.status_code == 200:
-                    resp_json = resp.json()
+                # Pin the listing to the branch's commit so the cache entry can be revalidated
+                head_sha = self._resolve_head_sha(owner, repo_name, branch, headers)
+                if not head_sha:
+                    continue
+                status, resp_json = self._get_tree(owner, repo_name, head_sha, headers)
+                if status == 200:
                     tree = resp_json.get('tree', [])
                     if resp_json.get('truncated'):
                         print(f"[!] Warning: Repository tree was truncated by GitHub API")
                     # Return list of paths (filter out directories)
-                    paths = [item['path'] for item in tree if item['type'] == 'blob']
-                    print(f"[*] Scan found {len(paths)} files on branch '{branch}'")
-                    return paths
-            
-            # If both branches failed, try to get default branch from repo info
-            repo_api_url = f"https://api.github.com/repos/{owner}/{repo_name}"
-            repo_resp = requests.get(repo_api_url, headers=headers)
-            if repo_resp.status_code == 200:
-                default_branch = repo_resp.json().get('default_branch', 'main')
-                api_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/trees/{default_branch}?recursive=1"
-                resp = requests.get(api_url, headers=headers)
-                if resp.status_code == 200:
-                    tree = resp.json().get('tree', [])
-                    return [item['path'] for item in tree if item['type'] == 'blob']
+                    blobs = {item['path']: item.get('sha') for item in tree if item['type'] == 'blob'}
+                    BLOB_SHA_CACHE.set(blob_key, blobs)
+                    print(f"[*] Scan found {len(blobs)} files on branch '{branch}' at {head_sha[:7]}")
+                    SCAN_CACHE.set(cache_key, blobs, etag=f"{branch}@{head_sha}")
+                    return list(blobs)
             
             return [f"(API Error - Could not find repository or branch)"]
                  
@@ -528,7 +743,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
         
         try:
             # Parse owner/repo
-            match = re.search(r"github\.com/([^/]+)/([^/.]+)", repo_url)
+            match = GITHUB_URL_RE.search(repo_url)
             if not match:
                 return result
             
@@ -539,23 +754,32 @@ This PR contains the **completely modernized** version of your legacy codebase.
                 headers["Authorization"] = f"token {self.github_token}"
             
             # Get default branch
-            repo_resp = requests.get(f"https://api.github.com/repos/{owner}/{repo_name}", headers=headers)
+            repo_resp = HTTP_SESSION.get(f"https://api.github.com/repos/{owner}/{repo_name}", headers=headers)
             default_branch = "main"
             if repo_resp.status_code == 200:
                 default_branch = repo_resp.json().get('default_branch', 'main')
             
-            # Get file tree
-            tree_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/trees/{default_branch}?recursive=1"
-            tree_resp = requests.get(tree_url, headers=headers, timeout=30)
-            
-            if tree_resp.status_code != 200:
-                print(f"[!] Failed to get repository tree: {tree_resp.status_code}")
-                _add_debug_log('ERROR', 'DEEP_SCAN', f'Tree API failed: HTTP {tree_resp.status_code}', {
-                    'response': tree_resp.text[:300]
-                })
+            # Resolve the branch HEAD (one tiny request) - an unchanged commit is served from disk
+            cache_key = None
+            head_sha = self._resolve_head_sha(owner, repo_name, default_branch, headers)
+            if head_sha:
+                cache_key = make_key(owner, repo_name, head_sha, "deep")
+                cached = get_cached_scan(cache_key)
+                if cached is not None:
+                    print(f"[*] Deep scan cache hit: {owner}/{repo_name}@{head_sha[:7]} ({len(cached.get('files', []))} files)")
+                    _add_debug_log('INFO', 'DEEP_SCAN', 'Served from scan cache', {'sha': head_sha})
+                    cached["from_cache"] = True
+                    return cached
+            
+            # Get file tree - at the resolved commit this is usually the listing
+            # /api/scan already fetched (TREE_CACHE)
+            tree_status, tree_json = self._get_tree(owner, repo_name, head_sha or default_branch, headers)
+            
+            if tree_status != 200:
+                print(f"[!] Failed to get repository tree: {tree_status}")
+                _add_debug_log('ERROR', 'DEEP_SCAN', f'Tree API failed: HTTP {tree_status}', {})
                 return result
             
-            tree_json = tree_resp.json()
             tree = tree_json.get('tree', [])
             
             if tree_json.get('truncated'):
@@ -615,6 +839,22 @@ This PR contains the **completely modernized** version of your legacy codebase.
             files_fetched = 0
             # NO LIMIT - Fetch ALL files! Gemini has a large context window.
             
+            # Skip dependency/build directories using PATH COMPONENT matching
+            # (NOT substring - 'dist' must not match 'distribution')
+            skip_dirs = {'node_modules', 'venv', '.venv', '__pycache__', '.git', 
+                         'dist', 'build', '.next', '.nuxt', 'coverage', '.cache',
+                         'vendor', 'bower_components', '.tox', 'egg-info', '.eggs'}
+            
+            # Skip binary/media files by extension
+            binary_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.ico', '.bmp', '.webp',
+                                 '.mp3', '.mp4', '.wav', '.avi', '.mkv', '.mov',
+                                 '.zip', '.tar', '.gz', '.rar', '.7z',
+                                 '.pdf', '.doc', '.docx', '.xls', '.xlsx',
+                                 '.woff', '.woff2', '.ttf', '.eot', '.otf',
+                                 '.pyc', '.pyo', '.so', '.dll', '.exe', '.o',
+                                 '.DS_Store', '.map'}
+            
+            to_fetch = []
             for item in tree:
                 if item['type'] != 'blob':
                     continue
@@ -634,23 +874,10 @@ This PR contains the **completely modernized** version of your legacy codebase.
                     'controller' in path.lower()
                 )
                 
-                # Skip dependency/build directories using PATH COMPONENT matching
-                # (NOT substring - 'dist' must not match 'distribution')
-                skip_dirs = {'node_modules', 'venv', '.venv', '__pycache__', '.git', 
-                             'dist', 'build', '.next', '.nuxt', 'coverage', '.cache',
-                             'vendor', 'bower_components', '.tox', 'egg-info', '.eggs'}
                 path_parts = set(path.replace('\\', '/').split('/'))
                 if path_parts & skip_dirs:  # Set intersection - only matches exact directory names
                     should_fetch = False
                 
-                # Skip binary/media files by extension
-                binary_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.ico', '.bmp', '.webp',
-                                     '.mp3', '.mp4', '.wav', '.avi', '.mkv', '.mov',
-                                     '.zip', '.tar', '.gz', '.rar', '.7z',
-                                     '.pdf', '.doc', '.docx', '.xls', '.xlsx',
-                                     '.woff', '.woff2', '.ttf', '.eot', '.otf',
-                                     '.pyc', '.pyo', '.so', '.dll', '.exe', '.o',
-                                     '.DS_Store', '.map'}
                 if ext.lower() in binary_extensions:
                     should_fetch = False
                 
@@ -661,29 +888,37 @@ This PR contains the **completely modernized** version of your legacy codebase.
                     should_fetch = False
                 
                 if should_fetch:
-                    content = self._fetch_file_content(
-                        owner, repo_name, path, default_branch, headers, item.get('sha')
-                    )
-                    
-                    if content is not None:
-                        lang = self._detect_language(path, content)
-                        
-                        result["files"].append({
-                            "path": path,
-                            "content": content,
-                            "language": lang
-                        })
-                        
-                        # Analyze this file for tech stack
-                        self._analyze_file_for_tech_stack(path, content, result)
-                        
-                        files_fetched += 1
-                        print(f"  [+] Fetched ({files_fetched}): {path}")
-                    
-                    # GitHub API rate limit protection: pause every 30 files
-                    if files_fetched > 0 and files_fetched % 30 == 0:
-                        print(f"  [⏳] Rate limit pause after {files_fetched} files...")
-                        time.sleep(1)
+                    to_fetch.append(item)
+            
+            # Fetches are network-bound, so fan them out over the pooled session;
+            # map() keeps tree order so the tech-stack analysis stays deterministic
+            def _fetch(item):
+                return self._fetch_file_content(
+                    owner, repo_name, item['path'], default_branch, headers, item.get('sha')
+                )
+            
+            with ThreadPoolExecutor(max_workers=DEEP_SCAN_FETCH_WORKERS) as pool:
+                contents = list(pool.map(_fetch, to_fetch))
+            
+            failed_paths = []
+            for item, content in zip(to_fetch, contents):
+                if content is None:
+                    failed_paths.append(item['path'])
+                    continue
+                path = item['path']
+                lang = self._detect_language(path, content)
+                
+                result["files"].append({
+                    "path": path,
+                    "content": content,
+                    "language": lang
+                })
+                
+                # Analyze this file for tech stack
+                self._analyze_file_for_tech_stack(path, content, result)
+                
+                files_fetched += 1
+                print(f"  [+] Fetched ({files_fetched}): {path}")
             
             print(f"[*] Deep scan complete: {files_fetched}/{len([i for i in tree if i['type']=='blob'])} files analyzed")
             
@@ -698,52 +933,130 @@ This PR contains the **completely modernized** version of your legacy codebase.
                 print(f"[!] WARNING: Only fetched {files_fetched}/{total_blobs} files ({100*files_fetched//total_blobs}%)")
                 _add_debug_log('WARNING', 'DEEP_SCAN', f'Low file fetch rate: {files_fetched}/{total_blobs}', {})
             
+            # One entry per variable name, in first-seen order
+            result["env_vars"] = list(dict.fromkeys(result["env_vars"]))
+            
             # Summarize what must be preserved vs modernized
             self._categorize_preservation_targets(result)
             
+            # The cache entry is permanent for this commit, so an incomplete scan (rate
+            # limits, timeouts) is not stored; the next scan refetches only the missing
+            # files, everything else comes from the blob-keyed file cache
+            if cache_key and files_fetched > 0 and not failed_paths:
+                put_cached_scan(cache_key, "deep", head_sha, result)
+            elif failed_paths:
+                print(f"[!] {len(failed_paths)} file(s) could not be fetched; deep scan not cached")
+                _add_debug_log('WARNING', 'DEEP_SCAN', f'{len(failed_paths)} files failed to fetch, scan not cached',
+                               {'failed': failed_paths[:10]})
+            
             return result
             
         except Exception as e:
             print(f"[!] Deep scan error: {str(e)}")
             return result
     
+    def _get_tree(self, owner: str, repo_name: str, commit_sha: str, headers: dict):
+        """
+        Recursive tree listing at commit_sha, shared by scan_repository and
+        scan_repository_deep through TREE_CACHE. Returns (status_code, tree_json).
+        """
+        cache_key = (owner.lower(), repo_name.lower(), commit_sha, self.github_token)
+        tree_json = TREE_CACHE.get(cache_key)
+        if tree_json is not None:
+            return 200, tree_json
+
+        # /api/analyze runs both scans at once; the second caller waits for the
+        # first one's listing instead of downloading the same tree again
+        with _TREE_FETCH_GUARD:
+            fetch_lock = _TREE_FETCH_LOCKS.setdefault(cache_key, threading.Lock())
+        try:
+            with fetch_lock:
+                tree_json = TREE_CACHE.get(cache_key)
+                if tree_json is not None:
+                    return 200, tree_json
+                resp = HTTP_SESSION.get(
+                    f"https://api.github.com/repos/{owner}/{repo_name}/git/trees/{commit_sha}?recursive=1",
+                    headers=headers, timeout=30,
+                )
+                if resp.status_code != 200:
+                    return resp.status_code, None
+                tree_json = resp.json()
+                TREE_CACHE.set(cache_key, tree_json)
+                return 200, tree_json
+        finally:
+            with _TREE_FETCH_GUARD:
+                _TREE_FETCH_LOCKS.pop(cache_key, None)
+
+    def _resolve_head_sha(self, owner: str, repo_name: str, branch: str, headers: dict) -> str:
+        """Commit SHA at the tip of branch, or None if it can't be resolved."""
+        try:
+            resp = HTTP_SESSION.get(
+                f"https://api.github.com/repos/{owner}/{repo_name}/commits/{branch}",
+                headers=dict(headers, Accept="application/vnd.github.sha"),
+                timeout=15,
+            )
+            if resp.status_code == 200:
+                return resp.text.strip() or None
+        except Exception as e:
+            print(f"[!] Could not resolve HEAD for {owner}/{repo_name}: {e}")
+        return None
+
     def _fetch_file_content(self, owner: str, repo_name: str, path: str, 
                             branch: str, headers: dict, blob_sha: str = None) -> str:
         """
+        Fetches file content, by blob SHA from the shared file cache when possible.
+        A new commit usually changes a handful of blobs, so a re-scan after a push
+        only downloads those; everything else (and /api/file-content) reuses the text.
+        Text that was not valid UTF-8 is returned but never cached under the SHA.
+        """
+        if blob_sha:
+            cached = get_cached_file(blob_sha)
+            if cached is not None:
+                return cached
+        content, exact = self._fetch_file_content_remote(owner, repo_name, path, branch, headers, blob_sha)
+        if content is not None and exact and blob_sha:
+            put_cached_file(blob_sha, content)
+        return content
+
+    def _fetch_file_content_remote(self, owner: str, repo_name: str, path: str,
+                                   branch: str, headers: dict, blob_sha: str = None) -> str:
+        """
         Fetches file content with multiple fallback strategies and retries.
         
         Strategy 1: GitHub Contents API (/contents/)
         Strategy 2: Raw content URL (raw.githubusercontent.com) 
         Strategy 3: Git Blob API (/git/blobs/) using SHA from tree
         
-        Returns file content string, or None if all strategies fail.
+        Returns (content, exact): content is None if all strategies fail, and exact is
+        False when the bytes were not valid UTF-8 and had to be decoded lossily.
         """
-        import base64
-        
         max_retries = 3
         
         for attempt in range(max_retries):
             # Strategy 1: Contents API (works for files < 1MB)
             try:
                 content_url = f"https://api.github.com/repos/{owner}/{repo_name}/contents/{path}?ref={branch}"
-                content_resp = requests.get(content_url, headers=headers, timeout=30)
+                content_resp = HTTP_SESSION.get(content_url, headers=headers, timeout=30)
                 
                 if content_resp.status_code == 200:
                     content_data = content_resp.json()
                     
                     # Handle array response (directory listing - skip)
                     if isinstance(content_data, list):
-                        return None
+                        return None, False
                     
                     if content_data.get('encoding') == 'base64' and content_data.get('content'):
-                        return base64.b64decode(content_data['content']).decode('utf-8', errors='ignore')
+                        return _decode_github_base64_exact(content_data['content'])
                     
                     # Some files return download_url instead
                     download_url = content_data.get('download_url')
                     if download_url:
-                        raw_resp = requests.get(download_url, timeout=30)
+                        raw_resp = HTTP_SESSION.get(download_url, timeout=30)
                         if raw_resp.status_code == 200:
-                            return raw_resp.text
+                            try:
+                                return raw_resp.content.decode('utf-8'), True
+                            except UnicodeDecodeError:
+                                return raw_resp.text, False
                 
                 elif content_resp.status_code == 403:
                     # File too large for Contents API (>1MB) or rate limited
@@ -754,7 +1067,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
                     continue
                     
                 elif content_resp.status_code == 404:
-                    return None  # File doesn't exist
+                    return None, False  # File doesn't exist
                     
                 elif content_resp.status_code == 429:
                     # Rate limited
@@ -773,17 +1086,17 @@ This PR contains the **completely modernized** version of your legacy codebase.
         # Strategy 2: Raw content URL (no size limit, no API rate limit)
         try:
             raw_url = f"https://raw.githubusercontent.com/{owner}/{repo_name}/{branch}/{path}"
-            raw_resp = requests.get(raw_url, timeout=30)
+            raw_resp = HTTP_SESSION.get(raw_url, timeout=30)
             if raw_resp.status_code == 200:
                 # Check if content looks like binary
                 try:
                     text = raw_resp.content.decode('utf-8')
                     # Heuristic: if > 10% null bytes, it's binary
                     if text.count('\x00') > len(text) * 0.1:
-                        return None
-                    return text
+                        return None, False
+                    return text, True
                 except UnicodeDecodeError:
-                    return None  # Binary file
+                    return None, False  # Binary file
         except Exception as e:
             print(f"  [!] Raw URL fallback failed for {path}: {e}")
         
@@ -791,11 +1104,11 @@ This PR contains the **completely modernized** version of your legacy codebase.
         if blob_sha:
             try:
                 blob_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/blobs/{blob_sha}"
-                blob_resp = requests.get(blob_url, headers=headers, timeout=30)
+                blob_resp = HTTP_SESSION.get(blob_url, headers=headers, timeout=30)
                 if blob_resp.status_code == 200:
                     blob_data = blob_resp.json()
                     if blob_data.get('encoding') == 'base64':
-                        return base64.b64decode(blob_data['content']).decode('utf-8', errors='ignore')
+                        return _decode_github_base64_exact(blob_data['content'])
             except Exception as e:
                 print(f"  [!] Blob API fallback failed for {path}: {e}")
         
@@ -803,7 +1116,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
         _add_debug_log('ERROR', 'DEEP_SCAN', f'Failed to fetch: {path}', {
             'owner': owner, 'repo': repo_name, 'branch': branch
         })
-        return None
+        return None, False
 
     def _detect_language(self, path: str, content: str) -> str:
         """Detect programming language from file path and content."""
@@ -891,16 +1204,13 @@ This PR contains the **completely modernized** version of your legacy codebase.
         if '@app.route' in content or '@app.get' in content or '@app.post' in content:
             result["must_preserve"].append(f"API endpoints in {path}")
             # Extract Python/Flask/FastAPI endpoint patterns
-            endpoints = re.findall(r'@app\.(get|post|put|delete|patch)\([\'"]([^\'"]+)[\'"]', content)
+            endpoints = _FLASK_ENDPOINT_RE.findall(content)
             for method, endpoint in endpoints:
                 result["api_endpoints"].append(f"{method.upper()} {endpoint}")
         
         # Also detect Express.js endpoints: app.get('/path', ...) or router.get('/path', ...)
         if 'app.get(' in content or 'app.post(' in content or 'router.get(' in content:
-            express_endpoints = re.findall(
-                r'(?:app|router)\.(get|post|put|delete|patch|options)\s*\(\s*[\'"]([^\'"]+)[\'"]',
-                content
-            )
+            express_endpoints = _EXPRESS_ENDPOINT_RE.findall(content)
             if express_endpoints:
                 result["must_preserve"].append(f"Express API endpoints in {path}")
                 for method, endpoint in express_endpoints:
@@ -910,7 +1220,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
         
         # Detect environment variables
         if '.env' in path or 'config' in path_lower:
-            env_vars = re.findall(r'([A-Z_][A-Z0-9_]+)\s*=', content)
+            env_vars = _ENV_ASSIGN_RE.findall(content)
             result["env_vars"].extend(env_vars[:10])  # Limit
     
     def _categorize_preservation_targets(self, result: dict):
@@ -978,6 +1288,12 @@ This PR contains the **completely modernized** version of your legacy codebase.
                 "temperature": 0.2,         # Low temp for code generation accuracy
             }
         }
+        # Encode the (possibly multi-MB) body once for every retry and fallback model;
+        # ensure_ascii=False keeps non-ASCII source as UTF-8 instead of 6-byte \u escapes
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        last_status = None
+        retry_after = None
 
         for model_idx, current_model in enumerate(all_models):
             is_fallback = model_idx > 0
@@ -1003,11 +1319,14 @@ This PR contains the **completely modernized** version of your legacy codebase.
             base_wait = 3
 
             for attempt in range(max_retries):
+                # Only a 429 on the final attempt should hand a Retry-After to the caller
+                retry_after = None
                 try:
                     call_start = time.time()
                     # 300s timeout for large code generation responses
-                    response = requests.post(actual_url, headers=headers, json=data, timeout=300)
+                    response = HTTP_SESSION.post(actual_url, headers=headers, data=body, timeout=300)
                     call_elapsed = time.time() - call_start
+                    last_status = response.status_code
                     
                     logger.info(f"   Gemini response: HTTP {response.status_code} in {call_elapsed:.2f}s | body_size={len(response.text)} chars (attempt {attempt+1}/{max_retries})")
                     _add_debug_log('INFO', 'GEMINI_API', f'Response: HTTP {response.status_code}', {
@@ -1048,7 +1367,8 @@ This PR contains the **completely modernized** version of your legacy codebase.
                     
                     elif response.status_code == 429:
                         # Rate limited - wait longer with jitter
-                        import random
+                        header_value = response.headers.get('Retry-After', '')
+                        retry_after = float(header_value) if header_value.replace('.', '', 1).isdigit() else None
                         wait = base_wait * (2 ** attempt) + random.uniform(0, 2)
                         logger.warning(f"   ⚠️ Rate limited (429). Retry {attempt+1}/{max_retries} in {wait:.1f}s...")
                         _add_debug_log('WARNING', 'GEMINI_API', f'Rate limited (429)', {
@@ -1120,6 +1440,8 @@ This PR contains the **completely modernized** version of your legacy codebase.
         raise GeminiAPIError(
             f"All Gemini models failed after retries. Models tried: {', '.join(all_models)}. Check your API key quota at https://aistudio.google.com/",
             models_tried=all_models,
+            last_status=last_status,
+            retry_after=retry_after,
         )
 
     def clean_code(self, text: str) -> str:
@@ -1130,6 +1452,24 @@ This PR contains the **completely modernized** version of your legacy codebase.
             return match.group(1).strip()
         return text.strip()
 
+    def _call_gemini_cached(self, prompt: str, model: str, use_cache: bool = True) -> tuple:
+        """
+        _call_gemini through scan_cache's llm_cache table (keyed on model + prompt).
+        Returns (response, cache_key): cache_key is None for a cache hit, otherwise the
+        caller hands (cache_key, response) back through its cache_writes list once the
+        response parses; process_resurrection_stream stores them with put_cached_llm
+        only after the generated code has passed the sandbox.
+        use_cache=False skips the lookup (a forced regeneration) but still returns a key.
+        """
+        cache_key = hashlib.sha256(f"{model}\0{prompt}".encode('utf-8', 'surrogatepass')).digest()
+        if use_cache:
+            cached = get_cached_llm(cache_key)
+            if cached is not None:
+                print(f"[*] LLM cache hit ({model}, {len(prompt):,} char prompt)")
+                _add_debug_log('INFO', 'LLM_CACHE', f'Cache hit for {model}', {'prompt_chars': len(prompt)})
+                return cached, None
+        return self._call_gemini(prompt, model=model), cache_key
+
     def _parse_files_from_response(self, response: str) -> list:
         """
         Robust XML file parser with multiple fallback strategies.
@@ -1143,13 +1483,12 @@ This PR contains the **completely modernized** version of your legacy codebase.
         def _clean_content(raw: str) -> str:
             """Strip markdown code fences the model sometimes wraps content in."""
             c = raw.strip()
-            c = re.sub(r'^```\w*\n', '', c)
-            c = re.sub(r'\n```\s*$', '', c)
+            c = _FENCE_OPEN_RE.sub('', c)
+            c = _FENCE_CLOSE_RE.sub('', c)
             return c
 
         # Strategy 1: Standard regex
-        pattern = r'<file\s+path="(.*?)">(.*?)</file>'
-        matches = re.findall(pattern, response, re.DOTALL)
+        matches = _FILE_TAG_RE.findall(response)
         for fp, content in matches:
             fp = fp.strip()
             if fp and fp not in seen_paths:
@@ -1159,8 +1498,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
             return files
 
         # Strategy 2: Single-quoted paths
-        pattern2 = r"<file\s+path=['\"]([^'\"]+)['\"]>(.*?)</file>"
-        matches2 = re.findall(pattern2, response, re.DOTALL)
+        matches2 = _FILE_TAG_QUOTED_RE.findall(response)
         for fp, content in matches2:
             fp = fp.strip()
             if fp and fp not in seen_paths:
@@ -1170,8 +1508,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
             return files
 
         # Strategy 3: Extra whitespace in tags
-        pattern3 = r'<file\s+path\s*=\s*"([^"]+)"\s*>(.*?)</file\s*>'
-        matches3 = re.findall(pattern3, response, re.DOTALL)
+        matches3 = _FILE_TAG_SPACED_RE.findall(response)
         for fp, content in matches3:
             fp = fp.strip()
             if fp and fp not in seen_paths:
@@ -1186,7 +1523,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
         current_content = []
 
         for line in response.split('\n'):
-            start_match = re.match(r'<file\s+path\s*=\s*["\']([^"\']+)["\']', line)
+            start_match = _FILE_OPEN_TAG_RE.match(line)
             if start_match:
                 # Save any previous file
                 if in_file and current_path and current_content:
@@ -1197,7 +1534,7 @@ This PR contains the **completely modernized** version of your legacy codebase.
                 current_path = start_match.group(1)
                 current_content = []
                 in_file = True
-                after_tag = re.sub(r'<file\s+path\s*=\s*["\'][^"\']+["\']>\s*', '', line)
+                after_tag = _FILE_OPEN_TAG_FULL_RE.sub('', line)
                 if after_tag.strip():
                     current_content.append(after_tag.rstrip())
                 continue
@@ -1230,13 +1567,16 @@ This PR contains the **completely modernized** version of your legacy codebase.
 
         return files
 
-    def generate_modernization_plan(self, repo_url: str, instructions: str, deep_scan_result: dict = None) -> str:
+    def generate_modernization_plan(self, repo_url: str, instructions: str, deep_scan_result: dict = None,
+                                    use_cache: bool = True, cache_writes: list = None) -> str:
         """
         PRESERVATION-FIRST PLANNING (v7.0 - LIGHTWEIGHT)
         
         Sends ONLY file paths, tech stack, and endpoint metadata to Gemini.
         NO full file contents in the plan prompt - keeps it fast and small.
         Also requests FILE GROUPINGS for batch processing.
+        The plan for an identical prompt is reused from the LLM cache unless use_cache is False;
+        a fresh plan is appended to cache_writes as (cache_key, plan) for the caller to store.
         """
         if deep_scan_result:
             tech_stack = deep_scan_result.get("tech_stack", {})
@@ -1276,7 +1616,10 @@ Group the files into batches for processing."""
         
         # Use planner model (2.0-flash: 2K RPM, planning is simple)
         try:
-            return self._call_gemini(prompt, model=self.planner_model)
+            plan, cache_key = self._call_gemini_cached(prompt, self.planner_model, use_cache)
+            if cache_key is not None and cache_writes is not None and "[ERROR]" not in plan:
+                cache_writes.append((cache_key, plan))
+            return plan
         except GeminiAPIError as e:
             logger.warning(f"[PLAN] Gemini API failed for planning: {e}")
             _add_debug_log('WARNING', 'PLAN', f'Planning API failed, building synthetic plan', {'error': str(e)})
@@ -1305,6 +1648,13 @@ Group the files into batches for processing."""
             group = parts[0] if len(parts) > 1 else "root"
             dir_groups.setdefault(group, []).append(fp)
         
+        # Joined once up front; += per file would re-copy the growing plan each time
+        file_list = "\n".join(f"- {p}" for p in file_paths)
+        batch_groups = "".join(
+            f"\n#### BATCH {i}: {group}\n" + "".join(f"- {f}\n" for f in group_files)
+            for i, (group, group_files) in enumerate(dir_groups.items(), 1)
+        )
+        
         plan = f"""# Fallback Modernization Plan for {repo_url}
 ## (Auto-generated from repository scan — Gemini API was unavailable)
 
@@ -1318,16 +1668,10 @@ Group the files into batches for processing."""
 - Frontend Framework: {frontend_tech.get('framework', 'Unknown')}
 
 ### Files ({len(file_paths)} total)
-{chr(10).join(f'- {p}' for p in file_paths)}
+{file_list}
 
 ### Batch Groups
-"""
-        for i, (group, group_files) in enumerate(dir_groups.items(), 1):
-            plan += f"\n#### BATCH {i}: {group}\n"
-            for f in group_files:
-                plan += f"- {f}\n"
-        
-        plan += """
+{batch_groups}
 ### Modernization Strategy
 1. PRESERVE all backend logic, API endpoints, and database schemas exactly
 2. Modernize the frontend with clean HTML/CSS/JS or React
@@ -1338,13 +1682,15 @@ Group the files into batches for processing."""
         _add_debug_log('INFO', 'PLAN', f'Fallback plan built: {len(plan)} chars', {})
         return plan
 
-    def generate_code(self, plan: str, deep_scan_result: dict = None, repo_url: str = None) -> dict:
+    def generate_code(self, plan: str, deep_scan_result: dict = None, repo_url: str = None,
+                      use_cache: bool = True, cache_writes: list = None) -> dict:
         """
         Returns info about the code to be generated (Multiple Files, Nested Structure).
         Uses PRESERVATION-FIRST prompt from prompts.py module.
         
         deep_scan_result: Contains existing codebase info for preservation.
         repo_url: Repository URL for loading resurrection memory.
+        cache_writes: Collects (cache_key, response) for a fresh response that parsed.
         Raises GeminiAPIError if the API is unreachable.
         """
         # Load resurrection memory for this repository
@@ -1362,11 +1708,13 @@ Group the files into batches for processing."""
         
         # Phase 2: Write Code -> Use coder model (3-flash: 1K RPM)
         # GeminiAPIError will propagate up to process_resurrection_stream's try/except
-        response = self._call_gemini(prompt, model=self.coder_model)
+        response, cache_key = self._call_gemini_cached(prompt, self.coder_model, use_cache)
         print(f"[DEBUG] {self.coder_model} Connected Successfully. Code Generated.")
         
         # Robust XML Parsing (multi-strategy)
         files = self._parse_files_from_response(response)
+        if files and cache_key is not None and cache_writes is not None:
+            cache_writes.append((cache_key, response))
             
         if not files:
             print(f"[!] XML parsing failed. Response preview: {response[:500]}")
@@ -1642,12 +1990,50 @@ Group the files into batches for processing."""
         if config_files:
             batches.append({"name": "Config & Dependencies", "files": config_files})
         
+        dir_batches = []
         for dir_path, dir_files in sorted(dir_groups.items()):
             batch_name = dir_path.replace('/', ' > ') if dir_path != "root" else "Root Files"
-            batches.append({"name": batch_name, "files": dir_files})
+            dir_batches.append({"name": batch_name, "files": dir_files})
+        batches.extend(self._pack_small_batches(dir_batches))
         
         return self._split_oversized_batches(batches, max_chars_per_batch)
 
+    def _pack_small_batches(self, batches: list, max_chars: int = BATCH_PACK_MAX_CHARS,
+                            max_files: int = BATCH_PACK_MAX_FILES) -> list:
+        """
+        Greedily merges consecutive batches while the merged batch stays within
+        max_chars and max_files, so a repo with many one-file directories costs a
+        few model calls instead of one per directory. Batches already over a limit
+        are passed through unchanged (_split_oversized_batches handles size).
+        """
+        result = []
+        current = None
+        current_chars = 0
+        for batch in batches:
+            batch_chars = sum(len(f.get("content", "")) for f in batch["files"])
+            if (current is not None
+                    and current_chars + batch_chars <= max_chars
+                    and len(current["files"]) + len(batch["files"]) <= max_files):
+                current["names"].append(batch["name"])
+                current["files"].extend(batch["files"])
+                current_chars += batch_chars
+                continue
+            if current is not None:
+                result.append(current)
+            current = {"names": [batch["name"]], "files": list(batch["files"])}
+            current_chars = batch_chars
+        if current is not None:
+            result.append(current)
+
+        packed = []
+        for group in result:
+            names = group["names"]
+            name = names[0] if len(names) == 1 else f"{names[0]} + {len(names) - 1} more"
+            packed.append({"name": name, "files": group["files"]})
+        if len(packed) < len(batches):
+            print(f"[BATCH] Packed {len(batches)} directory groups into {len(packed)} batches")
+        return packed
+
     def _split_oversized_batches(self, batches: list, max_chars: int) -> list:
         """
         Splits any batch that exceeds max_chars into smaller sub-batches.
@@ -1685,7 +2071,9 @@ Group the files into batches for processing."""
         
         return result
 
-    def generate_code_batched(self, plan: str, deep_scan_result: dict, repo_url: str = None, progress_callback=None) -> dict:
+    def generate_code_batched(self, plan: str, deep_scan_result: dict, repo_url: str = None, progress_callback=None,
+                              regenerate_only: list = None, use_cache: bool = True,
+                              generated_files: list = None, cache_writes: list = None) -> dict:
         """
         Multi-batch code generation: processes files in logical groups
         to avoid hitting API token limits.
@@ -1697,11 +2085,27 @@ Group the files into batches for processing."""
             deep_scan_result: Deep scan results with file contents
             repo_url: Repository URL for memory context
             progress_callback: Optional callable(msg) for progress updates
+            regenerate_only: Optional list of previously generated {"filename", "content"} dicts.
+                When given, ONLY these files are regenerated (auto-heal) and the result
+                contains just the regenerated files - the caller merges them.
+            generated_files: With regenerate_only, the full previously generated set, used
+                as cross-file context (manifest and signature summaries of the other files)
+            use_cache: Reuse cached Gemini responses for identical batch prompts
+                (auto-heal regeneration always calls Gemini)
+            cache_writes: Collects (cache_key, response) for fresh batch responses that
+                parsed; the caller stores them once the code has run cleanly
             
         Returns:
             dict with 'files', 'entrypoint', 'runtime'
         """
-        files = deep_scan_result.get("files", [])
+        if regenerate_only:
+            return self._regenerate_files(plan, regenerate_only, progress_callback, generated_files)
+
+        # Lockfiles / minified bundles are not regenerated (see prompts.split_prompt_files);
+        # they are added back verbatim for the sandbox by _with_kept_files
+        files, kept_files = split_prompt_files(deep_scan_result.get("files", []))
+        if kept_files:
+            print(f"[BATCH] Keeping {len(kept_files)} lockfile/minified/oversized file(s) out of the prompt (copied as-is)")
         total_files = len(files)
         
         # Small/Medium repos: use single-call approach (maximize based on model capacity)
@@ -1714,7 +2118,9 @@ Group the files into batches for processing."""
                 _add_debug_log('INFO', 'BATCH', f'Using single-call mode', {
                     'file_count': total_files, 'total_chars': total_chars, 'model': self.coder_model
                 })
-                return self.generate_code(plan, deep_scan_result, repo_url)
+                code_data = self.generate_code(plan, deep_scan_result, repo_url, use_cache=use_cache,
+                                               cache_writes=cache_writes)
+                return self._with_kept_files(code_data, kept_files)
         
         # Load memory context
         memory_context = ""
@@ -1738,8 +2144,8 @@ Group the files into batches for processing."""
             'batches': [{"name": b["name"], "files": len(b["files"])} for b in batches]
         })
         
-        # All file paths for cross-reference
-        all_file_paths = [f["path"] for f in files]
+        # All file paths for cross-reference (a tuple: the prompt builder memoizes its manifest on it)
+        all_file_paths = tuple(f["path"] for f in files)
         
         # Process each batch
         all_generated_files = []
@@ -1775,7 +2181,7 @@ Group the files into batches for processing."""
             _add_debug_log('DEBUG', 'BATCH', f'Batch {batch_idx+1} prompt size: {len(prompt):,} chars', {})
             
             try:
-                response = self._call_gemini(prompt, model=self.coder_model)
+                response, cache_key = self._call_gemini_cached(prompt, self.coder_model, use_cache)
             except GeminiAPIError as api_err:
                 print(f"[BATCH {batch_idx+1}] ❌ Gemini API error: {api_err}")
                 _add_debug_log('ERROR', 'BATCH', f'Batch {batch_idx+1} API error: {str(api_err)[:200]}', {})
@@ -1796,6 +2202,8 @@ Group the files into batches for processing."""
             
             # Parse generated files from response (robust multi-strategy parser)
             batch_generated = self._parse_files_from_response(response)
+            if batch_generated and cache_key is not None and cache_writes is not None:
+                cache_writes.append((cache_key, response))
             
             print(f"[BATCH {batch_idx+1}] ✅ Generated {len(batch_generated)}/{batch_file_count} files")
             _add_debug_log('INFO', 'BATCH', f'Batch {batch_idx+1} generated {len(batch_generated)} files', {
@@ -1903,11 +2311,98 @@ Group the files into batches for processing."""
         entrypoint, runtime = self._detect_entrypoint_and_runtime(all_generated_files)
         print(f"[BATCH] Smart Detection: Runtime={runtime}, Entrypoint={entrypoint}")
         
-        return {
+        return self._with_kept_files({
             "files": all_generated_files,
             "entrypoint": entrypoint,
             "runtime": runtime
-        }
+        }, kept_files)
+
+    def _with_kept_files(self, code_data: dict, kept_files: list) -> dict:
+        """
+        Adds the files kept out of the prompt (split_prompt_files) verbatim, so the
+        sandbox runs the complete tree: an oversized module or a .min.js that a page
+        loads must still be there. They are tagged "kept": True so they only go to the
+        sandbox: the artifacts and commit_all_files_to_github drop them.
+        """
+        if not kept_files:
+            return code_data
+        generated = {f["filename"] for f in code_data["files"]}
+        files = code_data["files"] + [
+            {"filename": f["path"], "content": f.get("content", ""), "kept": True}
+            for f in kept_files if f["path"] not in generated
+        ]
+        entrypoint, runtime = self._detect_entrypoint_and_runtime(files)
+        return {**code_data, "files": files, "entrypoint": entrypoint, "runtime": runtime}
+
+    def _regenerate_files(self, plan: str, broken_files: list, progress_callback=None,
+                          generated_files: list = None) -> dict:
+        """
+        Auto-heal fast path: regenerates only the files blamed by the last error.
+        The broken generated versions are sent as the batch sources, and `plan`
+        is expected to already carry the error context. The rest of generated_files
+        goes in as the manifest plus signature summaries, so imports across modules
+        stay visible to the model.
+        """
+        batch_files = [
+            {"path": f["filename"], "content": f["content"], "language": self._detect_language(f["filename"], f["content"])}
+            for f in broken_files
+        ]
+        paths = [f["path"] for f in batch_files]
+        generated_files = generated_files or broken_files
+        blamed = set(paths)
+        all_paths = tuple(f["filename"] for f in generated_files)
+        other_files = [f for f in generated_files if f["filename"] not in blamed]
+
+        print(f"[HEAL] Regenerating only {len(batch_files)} blamed file(s): {paths}")
+        _add_debug_log('INFO', 'HEAL', f'Incremental regeneration of {len(batch_files)} files', {'files': paths})
+        if progress_callback:
+            progress_callback(f"🩹 Regenerating {len(batch_files)} file(s) blamed by the error...")
+
+        prompt = get_batch_code_generation_prompt(
+            plan=plan,
+            batch_files=batch_files,
+            batch_index=0,
+            total_batches=1,
+            batch_name="Auto-Heal - Files Blamed By Error",
+            all_file_paths=all_paths,
+            previously_generated_summaries=extract_batch_summary(other_files) if other_files else "",
+            memory_context="",
+        )
+        response = self._call_gemini(prompt, model=self.coder_model)
+        regenerated = self._parse_files_from_response(response)
+
+        if not regenerated:
+            raise Exception(f"INCREMENTAL REGENERATION FAILED: no parseable files for {paths}")
+
+        return {"files": regenerated}
+
+    def _extract_error_files(self, error_message: str) -> list:
+        """
+        Pulls the source files blamed by a Python or Node.js traceback.
+        Python: File "backend/main.py", line 12
+        Node:   at foo (/home/user/server.js:10:5)
+        Returns paths in order of appearance, deduplicated.
+        """
+        if not error_message:
+            return []
+        blamed = _PY_TRACEBACK_FILE_RE.findall(error_message) + _NODE_STACK_FILE_RE.findall(error_message)
+        return list(dict.fromkeys(blamed))
+
+    def _match_blamed_files(self, blamed_paths: list, files: list) -> list:
+        """
+        Generated files named by traceback frames. A frame counts only if it is under
+        SANDBOX_HOME or is a relative path, and it must equal the file's path exactly:
+        a suffix match would blame a root-level main.py for a frame deep inside
+        site-packages/x/main.py or node_modules/.../server.js.
+        """
+        blamed = set()
+        for bp in blamed_paths:
+            if bp.startswith(SANDBOX_HOME):
+                bp = bp[len(SANDBOX_HOME):]
+            elif bp.startswith('/'):
+                continue  # library or system frame
+            blamed.add(bp[2:] if bp.startswith('./') else bp)
+        return [f for f in files if sanitize_path(f['filename']) in blamed]
 
     def infer_dependencies(self, files: list) -> list:
         """
@@ -1984,6 +2479,103 @@ Group the files into batches for processing."""
             
         return list(detected)
 
+    def _npm_install_frontend(self, frontend_dir: str, has_lockfile: bool):
+        """
+        Installs frontend dependencies in the sandbox.
+        Uses `npm ci` when a lockfile exists (no re-resolution of the dependency graph),
+        otherwise a plain install. Audit/fund network chatter is always skipped.
+        Only retries with --force if the first attempt actually fails (peer-dep conflicts).
+        """
+        if has_lockfile:
+            install_cmd = "npm ci --save=false --fund=false --audit=false --omit=optional --prefer-offline"
+        else:
+            install_cmd = "npm install --no-audit --no-fund --prefer-offline"
+
+        print(f"[*] Installing Frontend dependencies ({install_cmd.split(' --')[0]})...")
+        install_result = self.sandbox.commands.run(f"cd {frontend_dir} && {install_cmd}", timeout=300)
+
+        if install_result.exit_code != 0:
+            print(f"[!] npm install warning: {install_result.stderr[:200] if install_result.stderr else 'No stderr'}")
+            print("[*] Retrying frontend install with --force...")
+            install_result = self.sandbox.commands.run(
+                f"cd {frontend_dir} && npm install --force --no-audit --no-fund --prefer-offline", timeout=300
+            )
+            if install_result.exit_code != 0:
+                print(f"[!] Frontend install failed after --force retry: {install_result.stderr[:200] if install_result.stderr else 'No stderr'}")
+
+        return install_result
+
+    def _build_frontend(self, frontend_dir: str, files: list, is_next: bool):
+        """
+        Runs the production frontend build. For Next.js, lint and telemetry are
+        skipped (lint errors never block a resurrection) and, when the generated code
+        has no next.config of its own, a minimal one is written that ignores
+        ESLint/TypeScript failures during the build. Lint is turned off through the
+        environment rather than `-- --no-lint`, which a custom build script would
+        receive as an unknown flag.
+        """
+        # A root-level app comes in as "" - `cd ` and "/next.config.mjs" would miss it
+        frontend_dir = frontend_dir or "."
+        if not is_next:
+            return self.sandbox.commands.run(f"cd {frontend_dir} && CI=1 npm run build", timeout=300)
+
+        has_next_config = any(
+            (os.path.dirname(f['filename']) or ".") == frontend_dir and os.path.basename(f['filename']).startswith('next.config')
+            for f in files
+        )
+        if not has_next_config:
+            self.sandbox.files.write(
+                os.path.join(frontend_dir, "next.config.mjs"),
+                "/** @type {import('next').NextConfig} */\n"
+                "const nextConfig = { eslint: { ignoreDuringBuilds: true }, typescript: { ignoreBuildErrors: true } };\n"
+                "export default nextConfig;\n",
+            )
+
+        return self.sandbox.commands.run(
+            f"cd {frontend_dir} && NEXT_TELEMETRY_DISABLED=1 NEXT_DISABLE_ESLINT=1 CI=1 npm run build", timeout=300
+        )
+
+    def _wait_for_port(self, port: int, timeout: float = 15, interval: float = 0.5) -> bool:
+        """
+        Polls http://127.0.0.1:{port} from INSIDE the sandbox until any HTTP status
+        comes back (4xx/5xx still means the server is up) or `timeout` seconds pass.
+        The whole poll loop runs in a single sandbox command, so there is only one
+        round-trip regardless of how many probes it takes.
+        """
+        wait_script = f"""
+import time, urllib.request, urllib.error
+deadline = time.time() + {timeout}
+while time.time() < deadline:
+    try:
+        urllib.request.urlopen('http://127.0.0.1:{port}', timeout=2)
+        print('PORT_READY')
+        break
+    except urllib.error.HTTPError:
+        print('PORT_READY')
+        break
+    except Exception:
+        time.sleep({interval})
+"""
+        try:
+            result = self.sandbox.commands.run(f"python3 -c \"{wait_script}\"", timeout=int(timeout) + 10)
+            return "PORT_READY" in (result.stdout or "")
+        except Exception as e:
+            print(f"[!] Port {port} poll failed: {str(e)[:100]}")
+            time.sleep(2)
+            return False
+
+    def _read_log_tail(self, path: str, max_bytes: int = 4096) -> str:
+        """
+        Returns only the last `max_bytes` of a sandbox log file via `tail -c`,
+        so a crash-looping server's traceback spam never crosses the bridge in full.
+        Returns "" if the file can't be read.
+        """
+        try:
+            result = self.sandbox.commands.run(f"tail -c {max_bytes} {path} 2>/dev/null")
+            return result.stdout or ""
+        except Exception:
+            return ""
+
     def execute_in_sandbox(self, files: list, entrypoint: str, runtime: str = "python", deep_scan_result: dict = None):
         """
         Execute generated code in E2B sandbox.
@@ -2040,8 +2632,8 @@ Group the files into batches for processing."""
                     return f"Sandbox Error: Failed to create sandbox after retry: {retry_err}"
             
             # Write ALL files (with path sanitization for bash compatibility)
-            files_written = 0
-            files_failed = 0
+            upload_targets = []
+            dirs_needed = set()
             for file in files:
                 # Sanitize the filename to prevent bash shell issues
                 safe_filename = sanitize_path(file['filename'])
@@ -2050,25 +2642,36 @@ Group the files into batches for processing."""
                 if safe_filename != file['filename']:
                     print(f"  [!] Path sanitized: {file['filename']} -> {safe_filename}")
                 
-                # Create directories if needed
                 dir_path = os.path.dirname(safe_filename)
                 if dir_path and dir_path not in [".", ""]:
-                    try:
-                        # We can't easily mkdir -p in sandbox file write, so we run a command
-                        mkdir_result = self.sandbox.commands.run(f"mkdir -p '{dir_path}'")
-                        if mkdir_result.exit_code != 0:
-                            print(f"  [!] mkdir warning for {dir_path}: {mkdir_result.stderr}")
-                    except Exception as mkdir_err:
-                        print(f"  [!] mkdir failed for {dir_path}: {mkdir_err}")
-                        # Try alternative - just continue, file write might still work
-                        pass
-                
+                    dirs_needed.add(dir_path)
+                upload_targets.append((safe_filename, file['content']))
+            
+            # Create ALL directories in a single command before uploading
+            if dirs_needed:
                 try:
-                    self.sandbox.files.write(safe_filename, file['content'])
-                    files_written += 1
+                    dirs_arg = " ".join(f"'{d}'" for d in sorted(dirs_needed))
+                    mkdir_result = self.sandbox.commands.run(f"mkdir -p {dirs_arg}")
+                    if mkdir_result.exit_code != 0:
+                        print(f"  [!] mkdir warning: {mkdir_result.stderr}")
+                except Exception as mkdir_err:
+                    print(f"  [!] mkdir failed: {mkdir_err}")
+                    # Try alternative - just continue, file write might still work
+            
+            # Upload files concurrently (each write is a network round-trip to the sandbox)
+            def _upload(target):
+                safe_filename, content = target
+                try:
+                    self.sandbox.files.write(safe_filename, content)
+                    return True
                 except Exception as write_err:
-                    files_failed += 1
                     print(f"  [!] File write error for {safe_filename}: {write_err}")
+                    return False
+            
+            with ThreadPoolExecutor(max_workers=SANDBOX_UPLOAD_WORKERS) as pool:
+                results = list(pool.map(_upload, upload_targets))
+            files_written = sum(results)
+            files_failed = len(results) - files_written
             
             print(f"[*] Files written: {files_written}/{len(files)} ({files_failed} failed)")
             _add_debug_log('INFO', 'SANDBOX', f'Files written: {files_written}/{len(files)}', {
@@ -2359,10 +2962,9 @@ except:
                     print(f"[*] 🎨 JS Framework Detected: {frontend_type} at {frontend_dir}")
                     
                     # Install frontend dependencies
-                    print(f"[*] Installing Frontend dependencies (npm install)...")
-                    install_result = self.sandbox.commands.run(f"cd {frontend_dir} && npm install --force", timeout=300)
-                    if install_result.exit_code != 0:
-                        print(f"[!] npm install warning: {install_result.stderr[:200] if install_result.stderr else 'No stderr'}")
+                    lockfile_path = f"{frontend_dir}/package-lock.json" if frontend_dir else "package-lock.json"
+                    has_lockfile = any(f['filename'] == lockfile_path for f in files)
+                    self._npm_install_frontend(frontend_dir, has_lockfile)
                     
                     # Inject Backend URL into .env.local for Next.js
                     print(f"[*] Injecting Backend URL into frontend environment...")
@@ -2372,7 +2974,7 @@ except:
                     
                     # Build frontend (for Next.js, React)
                     print(f"[*] Building Frontend for production...")
-                    build_result = self.sandbox.commands.run(f"cd {frontend_dir} && npm run build", timeout=300)
+                    build_result = self._build_frontend(frontend_dir, files, is_next=(frontend_type == "Next.js"))
                     
                     if build_result.exit_code != 0:
                         error_output = (build_result.stderr or '') + (build_result.stdout or '')
@@ -2385,9 +2987,10 @@ except:
                     # Try different start commands based on framework
                     start_cmd = f"cd {frontend_dir} && npm start -- -p 3000 > frontend.log 2>&1"
                     self.sandbox.commands.run(start_cmd, background=True)
-                    
-                    # Wait for frontend to boot
-                    time.sleep(10)
+
+                    # Wait for frontend to boot (returns as soon as port 3000 answers)
+                    if not self._wait_for_port(3000):
+                        print("[!] Frontend did not answer on port 3000 within 15s")
                     
                     # Get frontend URL
                     frontend_host = self.sandbox.get_host(3000)
@@ -2439,6 +3042,7 @@ except:
                 # HEALTH CHECK LOOP (Backend)
                 print("[*] Waiting for Backend to boot...")
                 backend_success = False
+                log_content = None  # Tail of app.log, read at most once
                 for i in range(20): # Try for 60 seconds (increased from 45)
                     time.sleep(3)
                     try:
@@ -2471,13 +3075,11 @@ except Exception as e:
                     # Early log check after 5 attempts to diagnose issues faster
                     if i == 4:
                         try:
-                            early_log = self.sandbox.files.read("app.log")
+                            early_log = self._read_log_tail("app.log")
                             if early_log and len(early_log) > 10:
                                 print(f"[DEBUG] Early Log Check (Backend may have crashed):\n{early_log[:300]}")
                                 # Check for Python crash indicators
-                                crash_indicators = ["SyntaxError", "ImportError", "ModuleNotFoundError", 
-                                                   "NameError", "IndentationError", "AttributeError: module"]
-                                if any(indicator in early_log for indicator in crash_indicators):
+                                if _CRASH_INDICATOR_RE.search(early_log):
                                     print("[!] PYTHON ERROR DETECTED - Breaking health check loop early")
                                     log_content = early_log
                                     break  # Exit health check loop immediately
@@ -2487,22 +3089,20 @@ except Exception as e:
                 if not backend_success:
                     print("[!] Backend FAILED to start. Retrieving logs...")
                     
-                    # Check if log_content was already read in early check (from break)
-                    if 'log_content' not in locals():
-                        try:
-                            log_content = self.sandbox.files.read("app.log")
-                            print(f"[DEBUG] App Log (First 1000 chars):\n{log_content[:1000]}")
-                        except:
-                            log_content = "Could not read app.log"
+                    # Reuse the tail from the early check if we broke out on a crash
+                    if log_content is None:
+                        log_content = self._read_log_tail("app.log") or "Could not read app.log"
+                        print(f"[DEBUG] App Log (last {len(log_content)} chars):\n{log_content[-1000:]}")
                     else:
                         print(f"[DEBUG] Using early log check data ({len(log_content)} bytes)")
                     
                     # Also capture any Python syntax errors
-                    if "SyntaxError" in log_content or "ImportError" in log_content or "ModuleNotFoundError" in log_content:
+                    if _CODE_ERROR_RE.search(log_content):
                         print("[!] DETECTED CODE ERROR - Will trigger auto-regeneration")
                     
                     # Return with clear error marker for auto-retry
-                    return f"BACKEND_CRASH: {log_content[:800]}"
+                    # Tail of the log holds the actual exception line, so keep the end
+                    return f"BACKEND_CRASH: {log_content[-800:]}"
 
                 # Get Backend URL
                 backend_host = self.sandbox.get_host(8000)
@@ -2512,16 +3112,24 @@ except Exception as e:
                 # --- PHASE 2: FRONTEND LAUNCH (Dual Stack) ---
                 # Check for frontend: Next.js (package.json) OR static files (index.html)
                 # Detect BOTH frontend/ directory structure AND root-level frontend files
-                has_next_frontend = any("frontend/package.json" in f['filename'] for f in files)
-                has_static_frontend_in_dir = any("frontend/index.html" in f['filename'] for f in files)
-                has_static_frontend_root = any(f['filename'] == "index.html" or f['filename'].endswith("/index.html") and "frontend" not in f['filename'] for f in files)
+                # Exact path lookups (no substring false positives like "frontend/package.json.bak")
+                by_name = {f['filename']: f for f in files}
+                next_frontend_dir = next(
+                    (d for d in ("modernized_stack/frontend", "frontend") if f"{d}/package.json" in by_name), None
+                )
+                static_frontend_dir = next(
+                    (d for d in ("frontend", "modernized_stack/frontend") if f"{d}/index.html" in by_name), None
+                )
+                has_next_frontend = next_frontend_dir is not None
+                has_static_frontend_in_dir = static_frontend_dir is not None
+                has_static_frontend_root = "index.html" in by_name
                 
                 # Combine: frontend detected if EITHER in frontend/ dir OR at root
                 has_static_frontend = has_static_frontend_in_dir or has_static_frontend_root
                 
                 # Determine frontend directory
                 if has_static_frontend_in_dir:
-                    frontend_dir = "frontend"
+                    frontend_dir = static_frontend_dir
                 elif has_static_frontend_root:
                     frontend_dir = "."  # Serve from root
                 else:
@@ -2529,7 +3137,7 @@ except Exception as e:
                 
                 if has_next_frontend:
                     print("🚀 Detected Frontend. Initiating Dual-Stack Launch...")
-                    frontend_dir = "modernized_stack/frontend"
+                    frontend_dir = next_frontend_dir
                     
                     # CRITICAL: Create .env.local with backend URL BEFORE building
                     # Next.js bakes env vars at build time, not runtime
@@ -2539,11 +3147,11 @@ except Exception as e:
                     print(f"[DEBUG] Created .env.local with: NEXT_PUBLIC_API_URL={backend_url}")
                     
                     print("[*] Installing Node dependencies (Timeout: 300s)...")
-                    self.sandbox.commands.run(f"cd {frontend_dir} && npm install --force", timeout=300)
+                    self._npm_install_frontend(frontend_dir, f"{frontend_dir}/package-lock.json" in by_name)
                     
                     print(f"[*] Building Frontend for production (Backend URL: {backend_url})...")
                     # Now the build will include the backend URL
-                    build_result = self.sandbox.commands.run(f"cd {frontend_dir} && npm run build", timeout=300)
+                    build_result = self._build_frontend(frontend_dir, files, is_next=True)
                     
                     # Check for build errors
                     if build_result.exit_code != 0:
@@ -2558,8 +3166,9 @@ except Exception as e:
                     start_cmd = f"cd {frontend_dir} && npm start -- -p 3000"
                     self.sandbox.commands.run(f"{start_cmd} > frontend.log 2>&1", background=True)
                     
-                    # Wait for Frontend
-                    time.sleep(10) # Give Next.js a moment to spin up
+                    # Wait for Frontend (adaptive poll instead of a fixed 10s sleep)
+                    if not self._wait_for_port(3000):
+                        print("[!] Frontend did not answer on port 3000 within 15s")
                     frontend_host = self.sandbox.get_host(3000)
                     frontend_url = f"https://{frontend_host}"
                     
@@ -2642,19 +3251,23 @@ except Exception as e:
         except Exception as e:
             return f"Sandbox Error: {str(e)}"
 
-    def process_resurrection_stream(self, repo_url: str, instructions: str):
-        """Generator that yields logs and results in real-time."""
+    def process_resurrection_stream(self, repo_url: str, instructions: str, use_llm_cache: bool = True):
+        """
+        Generator that yields logs and results in real-time.
+        use_llm_cache=False makes the plan and code generation call Gemini even when an
+        identical prompt has a cached response.
+        """
         logs = []
         deep_scan_result = None  # Store deep scan for reuse
         
         def emit_log(msg):
             logs.append(msg)
-            logger.info(f"   ➡ {msg}")
+            logger.info("   ➡ %s", msg)
             _add_debug_log('INFO', 'RESURRECT', msg, {})
             return {"type": "log", "content": msg}
 
         def emit_debug(msg):
-            logger.debug(f"   🔍 {msg[:200]}")
+            logger.debug("   🔍 %.200s", msg)
             _add_debug_log('DEBUG', 'RESURRECT_DEBUG', msg[:500], {})
             return {"type": "debug", "content": msg}
 
@@ -2692,7 +3305,11 @@ except Exception as e:
         # 2. PRESERVATION-FIRST PLANNING
         yield emit_log("📋 Creating PRESERVATION-FIRST Modernization Plan...")
         
-        plan = self.generate_modernization_plan(repo_url, instructions, deep_scan_result)
+        # Fresh plan/code responses are stored in the LLM cache only once the first
+        # attempt's code has run cleanly in the sandbox; "parses" is not "works"
+        llm_cache_writes = []
+        plan = self.generate_modernization_plan(repo_url, instructions, deep_scan_result,
+                                                use_cache=use_llm_cache, cache_writes=llm_cache_writes)
         yield emit_debug(f"[DEBUG] Generated Plan:\n{plan}")
 
         if "[ERROR]" in plan:
@@ -2706,6 +3323,9 @@ except Exception as e:
         # 2. Code Gen with COMPREHENSIVE Auto-Healing Loop
         MAX_RETRIES = 3
         retry_count = 0
+        # Targeted heals that did not fix the run; after two, heal by full regeneration
+        partial_heal_failures = 0
+        last_heal_partial = False
         sandbox_logs = None
         files = []
         entrypoint = 'modernized_stack/backend/main.py'
@@ -2722,14 +3342,42 @@ except Exception as e:
                 
                 if retry_count > 0:
                     yield emit_log(f"🔧 Auto-Healing: Regenerating code (Attempt {retry_count + 1}/{MAX_RETRIES + 1})...")
+                    if last_heal_partial:
+                        partial_heal_failures += 1
+                        last_heal_partial = False
                     
                     # Build comprehensive error context for AI
                     error_context = self._build_error_context(all_errors)
                     plan_with_error = plan + error_context
-                    code_data = self.generate_code_batched(plan_with_error, deep_scan_result, repo_url, progress_callback=batch_progress)
+                    
+                    # Only regenerate the files the last error blames, if we can pin them down
+                    blamed_paths = self._extract_error_files(all_errors[-1]["message"]) if all_errors else []
+                    files_to_fix = self._match_blamed_files(blamed_paths, files)
+                    
+                    if files_to_fix and partial_heal_failures >= 2:
+                        yield emit_log("🩹 Targeted heal failed twice — regenerating all files...")
+                        files_to_fix = []
+                    
+                    if files_to_fix:
+                        yield emit_log(f"🩹 Error blames {len(files_to_fix)} file(s) — regenerating only those...")
+                        last_heal_partial = True
+                        code_data = self.generate_code_batched(plan_with_error, deep_scan_result, repo_url,
+                                                               progress_callback=batch_progress, regenerate_only=files_to_fix,
+                                                               generated_files=files)
+                        # Merge regenerated files into the previous set instead of replacing it
+                        regenerated = {f['filename']: f for f in code_data['files']}
+                        merged = [regenerated.pop(f['filename'], f) for f in files]
+                        merged.extend(regenerated.values())
+                        entrypoint, runtime = self._detect_entrypoint_and_runtime(merged)
+                        code_data = {"files": merged, "entrypoint": entrypoint, "runtime": runtime}
+                    else:
+                        code_data = self.generate_code_batched(plan_with_error, deep_scan_result, repo_url,
+                                                               progress_callback=batch_progress, use_cache=use_llm_cache)
                 else:
                     yield emit_log("🔨 Synthesizing Enhanced Infrastructure (Multi-Batch Engine v7.0)...")
-                    code_data = self.generate_code_batched(plan, deep_scan_result, repo_url, progress_callback=batch_progress)
+                    code_data = self.generate_code_batched(plan, deep_scan_result, repo_url,
+                                                           progress_callback=batch_progress, use_cache=use_llm_cache,
+                                                           cache_writes=llm_cache_writes)
                 
                 # Emit any batch progress messages
                 for msg in batch_progress_messages:
@@ -2777,7 +3425,11 @@ except Exception as e:
                         yield emit_log(f"❌ Auto-Heal Failed after {MAX_RETRIES + 1} attempts. Proceeding with partial result.")
                         break
                 else:
-                    # Success!
+                    # Success! A healed run's prompts carry error context, so only a clean
+                    # first attempt is worth replaying
+                    if retry_count == 0:
+                        for cache_key, response in llm_cache_writes:
+                            put_cached_llm(cache_key, response)
                     record_success(repo_url, decisions=["Resurrection completed successfully"], patterns_used=[f"Runtime: {runtime}", f"Entrypoint: {entrypoint}"])
                     yield emit_log("✅ Verifying System Integrity... All checks passed!")
                     break
@@ -2792,9 +3444,18 @@ except Exception as e:
                 })
                 
                 if retry_count < MAX_RETRIES:
-                    wait_secs = 15 * (retry_count + 1)  # 15s, 30s, 45s
-                    yield emit_log(f"⚠️ Gemini API unavailable. Waiting {wait_secs}s before retry {retry_count + 2}/{MAX_RETRIES + 1}...")
-                    time.sleep(wait_secs)
+                    # Honour the API's Retry-After if it sent one, else jittered exponential backoff
+                    # (capped like the backoff so one header cannot hold the job slot for long)
+                    if api_error.retry_after is not None:
+                        wait_secs = min(60, api_error.retry_after)
+                    else:
+                        wait_secs = min(60, (2 ** retry_count) + random.uniform(0, 1))
+                    yield emit_log(f"⚠️ Gemini API unavailable. Waiting {wait_secs:.1f}s before retry {retry_count + 2}/{MAX_RETRIES + 1}...")
+                    # One countdown line per second keeps the stream (and the client) moving
+                    wait_deadline = time.time() + wait_secs
+                    while (remaining := wait_deadline - time.time()) > 0:
+                        yield emit_log(f"⏳ Retrying Gemini in {remaining:.0f}s...")
+                        time.sleep(min(1, remaining))
                     retry_count += 1
                     sandbox_logs = f"GEMINI_API_ERROR: {error_str}"
                     continue
@@ -2827,7 +3488,7 @@ except Exception as e:
         # Extract HTML for preview
         preview = ""
         # Check logs for URL
-        url_match = re.search(r"\[PREVIEW_URL\] (https://[^\s]+)", sandbox_logs or "")
+        url_match = _PREVIEW_URL_RE.search(sandbox_logs or "")
         if url_match:
             preview = url_match.group(1) # It's a URL now, not HTML content
         else:
@@ -2835,13 +3496,15 @@ except Exception as e:
              pass
         
         # Check artifacts
-        for f in files:
-            if 'preview.html' in f['filename']:
-                # If we have a real URL, user defines if they want that or static HTML. 
-                # For now, let's prefer the Live Server URL if it exists!
-                if not preview.startswith("http"): 
-                    preview = f['content']
-                break
+        by_name = {f['filename']: f for f in files}
+        preview_file = by_name.get('preview.html') or next(
+            (f for name, f in by_name.items() if name.endswith('/preview.html')), None
+        )
+        if preview_file:
+            # If we have a real URL, user defines if they want that or static HTML. 
+            # For now, let's prefer the Live Server URL if it exists!
+            if not preview.startswith("http"): 
+                preview = preview_file['content']
         
         # Determine Status
         status = "Resurrected"
@@ -2855,7 +3518,7 @@ except Exception as e:
             "type": "result",
             "data": {
                 "logs": "\n".join(logs),
-                "artifacts": files,
+                "artifacts": [f for f in files if not f.get('kept')],
                 "preview": preview,
                 "status": status,
                 "retry_count": retry_count,
@@ -3011,13 +3674,26 @@ FIX ALL ISSUES AND REGENERATE COMPLETE, WORKING CODE.
 # Singleton
 engine = LazarusEngine()
 
-def process_resurrection(repo_url, instructions):
+def process_resurrection(repo_url, instructions, use_llm_cache=True):
     """Returns generator."""
-    return engine.process_resurrection_stream(repo_url, instructions)
+    return engine.process_resurrection_stream(repo_url, instructions, use_llm_cache)
 
 def commit_code(repo_url, filename, content):
     return engine.commit_to_github(repo_url, filename, content)
 
-def commit_all_files(repo_url, files):
-    """Commits ALL files and creates a PR in one action."""
-    return engine.commit_all_files_to_github(repo_url, files)
+def commit_all_files(repo_url, files, attempts: int = PR_RETRY_ATTEMPTS):
+    """
+    Commits ALL files and creates a PR in one action.
+    Failures flagged transient (GitHub 429/5xx, dropped connections) are retried up to
+    `attempts` times with jittered exponential backoff. Re-running is safe: git objects
+    are content-addressed, the branch is force-updated and an open PR is reused.
+    """
+    attempts = max(1, attempts)
+    for attempt in range(1, attempts + 1):
+        result = engine.commit_all_files_to_github(repo_url, files)
+        if not result.pop('transient', False) or attempt == attempts:
+            result['attempts'] = attempt
+            return result
+        wait = PR_RETRY_BACKOFF * (2 ** (attempt - 1)) + random.random() * 0.1
+        print(f"[*] PR creation failed transiently ({result.get('message', '')[:100]}); retry {attempt}/{attempts - 1} in {wait:.1f}s")
+        time.sleep(wait)
@@ -1,21 +1,143 @@
+import argparse
+import bisect
+import gzip
+import hashlib
+import itertools
 import json
 import time
 import logging
+import os
+import queue
+import re
 import threading
-from collections import deque
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from socketserver import ThreadingMixIn
-from lazarus_agent import process_resurrection, commit_code, LazarusEngine
+from urllib.parse import urlparse, parse_qs
+from lazarus_agent import (
+    process_resurrection, commit_code, commit_all_files, PR_RETRY_ATTEMPTS, engine, set_debug_log_sink,
+    HTTP_SESSION, GITHUB_URL_RE, SCAN_CACHE, BLOB_SHA_CACHE, decode_github_base64,
+)
+from scan_cache import get_cached_file, put_cached_file, get_cached_llm, put_cached_llm
+from ttl_cache import TTLCache
+from prompts import get_analysis_prompt
+import socket
 import sys
 import traceback
 
+# orjson is optional: ~3x faster serialization and returns bytes directly
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# msgpack is optional: enables the length-prefixed binary stream format
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+
+def json_bytes(obj) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes (orjson when available, stdlib json otherwise)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj).encode('utf-8')
+
+
+# Pre-serialized heads for the {"type": "log"|"debug", "content": str} chunks that
+# make up most of a resurrection stream; only the content string is encoded per line
+_NDJSON_PREFIXES = {t: b'{"type":"%s","content":' % t.encode() for t in ('log', 'debug')}
+
+
+def ndjson_line(obj) -> bytes:
+    """Serialize obj as one NDJSON line; orjson appends the newline in C, no str round-trip."""
+    if ORJSON_AVAILABLE:
+        if len(obj) == 2:
+            prefix = _NDJSON_PREFIXES.get(obj.get('type'))
+            content = obj.get('content')
+            if prefix is not None and type(content) is str:
+                return b"".join((prefix, orjson.dumps(content), b"}\n"))
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + "\n").encode('utf-8')
+
+
+def msgpack_frame(obj) -> bytes:
+    """Serialize obj as one msgpack frame: 4-byte big-endian length, then the payload."""
+    packed = msgpack.packb(obj, use_bin_type=True)
+    return len(packed).to_bytes(4, 'big') + packed
+
+
+def json_loads(data):
+    """Parse JSON from bytes, memoryview or str (orjson when available)."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
 # ══════════════════════════════════════════════════════════════
 # DETAILED LOGGING SYSTEM
 # ══════════════════════════════════════════════════════════════
 
-# Ring buffer for debug logs (last 2000 entries)
-debug_log_buffer = deque(maxlen=2000)
-debug_log_lock = threading.Lock()
+class LogRing:
+    """
+    Fixed-size ring of debug log entries (stored pre-serialized as JSON bytes),
+    appended to without a lock.
+
+    Each writer claims a slot with next() on an itertools.count, which is atomic
+    under the GIL, and stores its entry at seq & mask. Entry timestamps are
+    mirrored into a parallel array('d'); since entries arrive in timestamp order,
+    a poll bisects that array for its cut-point (~11 comparisons for 2048 slots)
+    and slices, instead of comparing every entry.
+    """
+
+    def __init__(self, capacity: int = 2048):
+        if capacity & (capacity - 1):
+            raise ValueError("LogRing capacity must be a power of two")
+        self.buf = [None] * capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.mask = capacity - 1
+        self._seq = itertools.count()
+        self._tail = 0  # one past the newest published slot
+
+    def append(self, timestamp: float, entry):
+        seq = next(self._seq)
+        idx = seq & self.mask
+        self.timestamps[idx] = timestamp
+        self.buf[idx] = entry
+        if seq >= self._tail:
+            self._tail = seq + 1
+
+    def since(self, timestamp: float) -> list:
+        """Entries newer than timestamp, oldest first."""
+        tail = self._tail
+        first = max(tail - len(self.buf), 0)
+        window = _RingWindow(self.timestamps, first, tail - first, self.mask)
+        start = first + bisect.bisect_right(window, timestamp)
+        buf, mask = self.buf, self.mask
+        return [buf[seq & mask] for seq in range(start, tail) if buf[seq & mask] is not None]
+
+
+class _RingWindow:
+    """Read-only sequence view of ring slots first..first+length, for bisect."""
+    __slots__ = ('data', 'first', 'length', 'mask')
+
+    def __init__(self, data, first: int, length: int, mask: int):
+        self.data, self.first, self.length, self.mask = data, first, length, mask
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.data[(self.first + i) & self.mask]
+
+
+# Ring buffer for debug logs (last 2048 entries)
+debug_log_buffer = LogRing(2048)
 
 class ColorFormatter(logging.Formatter):
     """Colored terminal output for detailed backend logs."""
@@ -30,26 +152,94 @@ class ColorFormatter(logging.Formatter):
     BOLD = '\033[1m'
     DIM = '\033[2m'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Colored level column, built once per level instead of per record
+        self.level_prefix = {
+            level: f"{color}{self.BOLD}{level:<8}{self.RESET}" for level, color in self.COLORS.items()
+        }
+        # strftime result for the current second; a burst of records shares one call
+        self._stamp_cache = (None, '')
+
     def format(self, record):
-        color = self.COLORS.get(record.levelname, '')
-        timestamp = self.formatTime(record, '%H:%M:%S.') + f'{record.msecs:03.0f}'
+        prefix = self.level_prefix.get(record.levelname)
+        if prefix is None:
+            prefix = f"{self.BOLD}{record.levelname:<8}{self.RESET}"
+        second = int(record.created)
+        cached_second, stamp = self._stamp_cache
+        if second != cached_second:
+            stamp = self.formatTime(record, '%H:%M:%S.')
+            self._stamp_cache = (second, stamp)
         module = f'{record.module}:{record.lineno}'
         msg = record.getMessage()
-        return f"{self.DIM}[{timestamp}]{self.RESET} {color}{self.BOLD}{record.levelname:<8}{self.RESET} {self.DIM}{module:<25}{self.RESET} {msg}"
+        return f"{self.DIM}[{stamp}{record.msecs:03.0f}]{self.RESET} {prefix} {self.DIM}{module:<25}{self.RESET} {msg}"
+
+# add_debug_log only enqueues; one writer thread builds the entries and appends them
+_debug_log_queue = queue.SimpleQueue()
+_DEBUG_LOG_BATCH = 256
+
 
 def add_debug_log(level: str, category: str, message: str, details: dict = None):
-    """Add a structured debug log entry to the ring buffer."""
-    entry = {
-        "timestamp": time.time(),
-        "time_str": time.strftime('%H:%M:%S', time.localtime()) + f'.{int(time.time() * 1000) % 1000:03d}',
-        "level": level,
-        "category": category,
-        "message": message,
-        "details": details or {}
-    }
-    with debug_log_lock:
-        debug_log_buffer.append(entry)
-    return entry
+    """Queue a structured debug log entry for the ring buffer (no formatting on the caller's thread)."""
+    _debug_log_queue.put((time.time(), level, category, message, details))
+
+
+class LazyTraceback:
+    """
+    An exception's traceback, formatted on first str(). Holds the exception rather
+    than calling format_exc() up front, so it still works when str() runs on the
+    debug-log writer thread.
+    """
+    __slots__ = ('error', '_text')
+
+    def __init__(self, error: BaseException):
+        self.error = error
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = ''.join(traceback.format_exception(type(self.error), self.error, self.error.__traceback__))
+            self.error = None  # drop the frames once formatted
+        return self._text
+
+
+def _encode_log_entry(entry: dict) -> bytes:
+    """Serialize a log entry once; details that aren't JSON types are stringified."""
+    try:
+        return json_bytes(entry)
+    except (TypeError, ValueError):
+        return json.dumps(entry, default=str).encode('utf-8')
+
+
+def _debug_log_writer():
+    """Drain queued log entries in batches into debug_log_buffer."""
+    last_second, second_str = None, ''
+    while True:
+        batch = [_debug_log_queue.get()]
+        try:
+            while len(batch) < _DEBUG_LOG_BATCH:
+                batch.append(_debug_log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        for timestamp, level, category, message, details in batch:
+            second = int(timestamp)
+            if second != last_second:
+                last_second, second_str = second, time.strftime('%H:%M:%S', time.localtime(timestamp))
+            debug_log_buffer.append(timestamp, _encode_log_entry({
+                "timestamp": timestamp,
+                "time_str": f"{second_str}.{int(timestamp * 1000) % 1000:03d}",
+                "level": level,
+                "category": category,
+                "message": message,
+                "details": details or {}
+            }))
+
+
+threading.Thread(target=_debug_log_writer, name='debug-log-writer', daemon=True).start()
+
+# Engine-side _add_debug_log calls land in this module's buffer (main.py runs as
+# __main__, so a lazy "from main import" would load a second copy of it)
+set_debug_log_sink(add_debug_log)
 
 # Setup root logger
 logger = logging.getLogger('lazarus')
@@ -63,9 +253,164 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 logging.getLogger('requests').setLevel(logging.WARNING)
 
 
-class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
-    """Handle requests in separate threads for concurrent access."""
-    daemon_threads = True
+# Scatter-gather output for NDJSON streams (not available on Windows)
+_HAS_WRITEV = hasattr(os, 'writev')
+_IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+# zlib level for gzip-encoded streams: the result chunk carries every generated file,
+# and level 1 already shrinks source-heavy JSON several-fold at a fraction of level 6's CPU
+STREAM_GZIP_LEVEL = 1
+
+
+class NDJSONWriter:
+    """
+    Coalesces NDJSON lines into fewer socket writes.
+
+    Lines are buffered and flushed when the buffer reaches max_bytes, when a
+    milestone chunk (files/analysis/result/error) is written, or max_delay seconds after the
+    first buffered line. The delay flush runs on a timer so a log line is never
+    held back while the generator blocks on a long Gemini/E2B call.
+
+    When the raw socket is given and the platform has os.writev, the buffered
+    lines go out in one scatter-gather syscall without being joined first.
+
+    With compress=True the stream is one gzip member: each flush is a deflate
+    sync point, so the client can decode every line as soon as it arrives.
+    close() writes the gzip trailer and must end a compressed stream.
+    """
+    MILESTONE_TYPES = frozenset({'result', 'error', 'files', 'analysis'})
+
+    def __init__(self, wfile, sock=None, max_bytes: int = 16384, max_delay: float = 0.05, encode=ndjson_line,
+                 compress: bool = False):
+        self.wfile = wfile
+        self.encode = encode
+        self._zlib = zlib.compressobj(STREAM_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+        self._compressed_any = False
+        self.sock = sock if _HAS_WRITEV and not compress else None
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._bufs = []
+        self._size = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def write(self, chunk: dict) -> bytes:
+        """Queue one chunk as an NDJSON line (or frame); returns the encoded bytes."""
+        line = self.encode(chunk)
+        with self._lock:
+            self._bufs.append(line)
+            self._size += len(line)
+            if self._size >= self.max_bytes or chunk.get('type') in self.MILESTONE_TYPES:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self._timer_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return line
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Flush, then end the gzip member (no-op for uncompressed streams)."""
+        with self._lock:
+            self._flush_locked()
+            if self._zlib is not None:
+                z, self._zlib = self._zlib, None
+                if self._compressed_any:
+                    self.wfile.write(z.flush())
+
+    def _timer_flush(self):
+        try:
+            self.flush()
+        except OSError:
+            # Client went away; the handler thread hits the same error on its next write
+            pass
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._bufs:
+            return
+        bufs, self._bufs, self._size = self._bufs, [], 0
+        if self._zlib is not None:
+            self._compressed_any = True
+            self.wfile.write(self._zlib.compress(b"".join(bufs)) + self._zlib.flush(zlib.Z_SYNC_FLUSH))
+        elif self.sock is not None:
+            self._writev(bufs)
+        else:
+            self.wfile.write(b"".join(bufs))
+            self.wfile.flush()
+
+    def _writev(self, bufs: list):
+        """os.writev the buffers, in IOV_MAX slices, resuming after partial writes."""
+        fd = self.sock.fileno()
+        while bufs:
+            batch = bufs[:_IOV_MAX]
+            sent = os.writev(fd, batch)
+            done = 0
+            while done < len(batch) and sent >= len(batch[done]):
+                sent -= len(batch[done])
+                done += 1
+            bufs = bufs[done:]
+            if sent:
+                bufs[0] = memoryview(bufs[0])[sent:]
+
+def iter_in_background(gen, on_done=None):
+    """
+    Run a blocking generator on the shared job pool and yield its items through a
+    bounded queue, so Gemini/GitHub/E2B waits in the producer overlap with socket
+    writes in the handler thread. Exceptions from the generator are re-raised here;
+    if the consumer stops early (client disconnect) the producer closes the generator.
+
+    on_done is called exactly once, when the job worker is actually free again: an
+    abandoned producer keeps its worker until its current Gemini/sandbox call returns.
+    """
+    events = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def _put(event) -> bool:
+        # Bounded put that gives up once the consumer has gone away, so a dead
+        # stream never pins a job worker
+        while not stop.is_set():
+            try:
+                events.put(event, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in gen:
+                if stop.is_set() or not _put(('item', item)):
+                    gen.close()
+                    return
+        except BaseException as e:
+            _put(('error', e))
+        finally:
+            _put(('done', None))
+            if on_done is not None:
+                on_done()
+
+    submitted = False
+    try:
+        _JOB_POOL.submit(_produce)
+        submitted = True
+        while True:
+            kind, item = events.get()
+            if kind == 'item':
+                yield item
+            elif kind == 'error':
+                raise item
+            else:
+                return
+    finally:
+        stop.set()
+        if not submitted and on_done is not None:
+            on_done()
 
 # Load .env file
 from dotenv import load_dotenv
@@ -73,10 +418,408 @@ load_dotenv()
 
 PORT = 8000
 
+# Connections handled concurrently; extra connections queue until a worker frees up
+HTTP_THREADS = int(os.environ.get("LAZARUS_HTTP_THREADS", min(32, max(8, (os.cpu_count() or 1) * 4))))
+
+# Long-running generator jobs (resurrections) run here, off the HTTP worker threads
+JOB_WORKERS = int(os.environ.get("LAZARUS_JOB_WORKERS", "4"))
+_JOB_POOL = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='lazarus-job')
+
+# One slot per job worker; a resurrection that finds none waits up to
+# RESURRECT_QUEUE_TIMEOUT seconds for one and then fails with a "busy" result
+RESURRECT_SLOTS = threading.BoundedSemaphore(JOB_WORKERS)
+RESURRECT_QUEUE_TIMEOUT = float(os.environ.get("LAZARUS_RESURRECT_QUEUE_TIMEOUT", "600"))
+
+# Chunks a job may run ahead of a slow client before it blocks
+JOB_QUEUE_SIZE = 128
+
+# Per-chunk stream logging (console debug lines + debug-log ring entries with a
+# content preview). Off by default: previewing a result chunk stringifies every artifact.
+VERBOSE_STREAM = os.environ.get("LAZARUS_VERBOSE_STREAM", "0") == "1"
+
+# /api/analyze runs the file-tree scan and the deep scan concurrently; set to 0 to run them in sequence
+ANALYZE_PARALLEL_SCANS = os.environ.get("LAZARUS_PARALLEL_SCANS", "1") != "0"
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles each connection on a bounded, reused worker pool."""
+
+    def __init__(self, server_address, handler_class, max_workers: int = HTTP_THREADS):
+        self.max_workers = max_workers
+        self._executor = None
+        super().__init__(server_address, handler_class)
+
+    def server_activate(self):
+        super().server_activate()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='lazarus-http')
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def shutdown_workers(self):
+        """Drop queued connections and wait for in-flight requests to finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+# Seconds a kept-alive connection may sit idle before its worker drops it
+KEEPALIVE_IDLE_TIMEOUT = float(os.environ.get("LAZARUS_KEEPALIVE_TIMEOUT", "5"))
+
+# Seconds a client may stall while sending the request body; streamed responses drop it
+BODY_READ_TIMEOUT = float(os.environ.get("LAZARUS_BODY_READ_TIMEOUT", "30"))
+
+# Kernel send buffer per connection, so a large files/result chunk is handed off in one go
+SOCKET_SNDBUF = 256 * 1024
+
+# Largest accepted POST body (create-pr carries every generated file); checked against
+# Content-Length before anything is read, so oversized requests cost nothing
+MAX_BODY = int(os.environ.get("LAZARUS_MAX_BODY", 16 * 1024 * 1024))
+_BODY_READ_CHUNK = 64 * 1024
+# Bodies up to this size are read into a reused per-thread buffer; larger ones
+# (multi-MB create-pr payloads) get a one-off allocation so workers don't pin them
+_BODY_REUSE_MAX = 1024 * 1024
+_body_buffers = threading.local()
+
+# Opt-in binary stream format (Accept header); NDJSON stays the default
+MSGPACK_STREAM_TYPE = "application/x-msgpack-stream"
+
+# Precomputed response header blocks for the hot JSON/NDJSON paths
+_JSON_CORS_HEADERS = b"Content-Type: application/json\r\nAccess-Control-Allow-Origin: *\r\n"
+_NDJSON_CORS_HEADERS = (b"Content-Type: application/x-ndjson\r\nAccess-Control-Allow-Origin: *\r\n"
+                        b"Cache-Control: no-cache\r\nConnection: close\r\n")
+_MSGPACK_STREAM_CORS_HEADERS = _NDJSON_CORS_HEADERS.replace(b"application/x-ndjson", MSGPACK_STREAM_TYPE.encode())
+_GZIP_ENCODING_HEADERS = b"Content-Encoding: gzip\r\nVary: Accept-Encoding\r\n"
+_JSON_GZIP_HEADERS = _JSON_CORS_HEADERS + _GZIP_ENCODING_HEADERS
+_PREFLIGHT_HEADERS = (b"Access-Control-Allow-Origin: *\r\nAccess-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+                      b"Access-Control-Allow-Headers: Content-Type, X-Lazarus-Retry-Attempts\r\n")
+_NOT_FOUND_HEADERS = b"Access-Control-Allow-Origin: *\r\n"
+_CONNECTION_CLOSE_HEADER = b"Connection: close\r\n"
+_PR_CACHE_HIT_HEADERS = b"X-Lazarus-Cache: HIT\r\nAccess-Control-Expose-Headers: X-Lazarus-Cache\r\n"
+_PR_CACHE_MISS_HEADERS = _PR_CACHE_HIT_HEADERS.replace(b"HIT", b"MISS")
+_STATUS_LINES = {}
+
+# JSON bodies at least this large are gzipped (level 1) when the client accepts it
+GZIP_MIN_BYTES = 1024
+
+# GitHub file reads for /api/file-content, keyed on (api_url, token); stale entries
+# are revalidated with If-None-Match. Write paths (/api/commit, /api/create-pr) are not cached.
+FILE_CONTENT_CACHE = TTLCache(maxsize=2048, ttl=60)
+
+# File text by git blob SHA (immutable content), in front of scan_cache's file_cache table
+BLOB_CONTENT_CACHE = TTLCache(maxsize=2048, ttl=24 * 3600)
+
+# Successful /api/create-pr results keyed on the request digest, so a retried or
+# double-submitted PR returns the first result instead of re-running every GitHub call
+PR_RESULT_CACHE = TTLCache(maxsize=64, ttl=600)
+
+# Upper bound for a client-supplied X-Lazarus-Retry-Attempts on /api/create-pr
+PR_MAX_RETRY_ATTEMPTS = 5
+
+def _pr_request_key(repo_url: str, files) -> bytes:
+    """Digest of a create-pr request: repo URL plus every (filename, content) pair in order."""
+    h = hashlib.sha256(repo_url.encode('utf-8'))
+    for f in files:
+        h.update(b'\0')
+        h.update(str(f.get('filename')).encode('utf-8'))
+        h.update(b'\0')
+        h.update(str(f.get('content')).encode('utf-8', 'surrogatepass'))
+    return h.digest()
+
+
+# (connect, read) timeouts for file-content calls on the shared pooled session; a stalled
+# GitHub connection must not pin an HTTP worker indefinitely
+GITHUB_FILE_TIMEOUT = (3, 10)
+
+# Upper bound on bytes read from a single file for the viewer
+FILE_CONTENT_MAX_BYTES = 2 * 1024 * 1024
+
+
+def _fetch_github_file_base64(api_url: str, headers: dict, cache_key) -> tuple:
+    """Fallback for _fetch_github_file_remote when the raw media type is not accepted."""
+    headers = dict(headers, Accept="application/vnd.github.v3+json")
+    headers.pop("If-None-Match", None)
+    resp = HTTP_SESSION.get(api_url, headers=headers, timeout=GITHUB_FILE_TIMEOUT)
+    if resp.status_code != 200:
+        return resp.status_code, None, None, False
+
+    data = json_loads(resp.content)
+    content = decode_github_base64(data.get("content", ""), errors="replace")
+    etag = resp.headers.get("ETag")
+    FILE_CONTENT_CACHE.set(cache_key, content, etag)
+    return 200, content, etag, False
+
+
+def _cached_blob_content(owner: str, repo_name: str, file_path: str) -> tuple:
+    """(blob_sha, content) from the blob-keyed caches; either may be None."""
+    blob_sha = None
+    blobs = BLOB_SHA_CACHE.get((owner.lower(), repo_name.lower(), os.getenv("GITHUB_TOKEN")))
+    if blobs:
+        blob_sha = blobs.get(file_path)
+    if not blob_sha:
+        return None, None
+
+    content = BLOB_CONTENT_CACHE.get(blob_sha)
+    if content is None:
+        content = get_cached_file(blob_sha)
+        if content is not None:
+            BLOB_CONTENT_CACHE.set(blob_sha, content)
+    return blob_sha, content
+
+
+def fetch_github_file(owner: str, repo_name: str, file_path: str, if_none_match: str = None) -> tuple:
+    """
+    Fetch a repository file's text. Returns (status, content, etag, truncated); content is
+    None when GitHub answered with a non-200 status, and truncated is True when the file
+    was cut at FILE_CONTENT_MAX_BYTES.
+
+    If the last /api/scan recorded the file's blob SHA, the text is served from the
+    blob-keyed cache (memory, then scan_cache's SQLite table) without calling GitHub.
+    Otherwise it goes to the contents API through FILE_CONTENT_CACHE.
+    """
+    blob_sha, content = _cached_blob_content(owner, repo_name, file_path)
+    if content is not None:
+        return 200, content, f'"{blob_sha}"', False
+
+    status, content, etag, truncated = _fetch_github_file_remote(owner, repo_name, file_path, if_none_match)
+    # A blob SHA names exact bytes: neither a truncated prefix nor text with U+FFFD
+    # replacements (invalid UTF-8) may be stored under it
+    if status == 200 and blob_sha and not truncated and "\ufffd" not in content:
+        BLOB_CONTENT_CACHE.set(blob_sha, content)
+        put_cached_file(blob_sha, content)
+    return status, content, etag, truncated
+
+
+def _fetch_github_file_remote(owner: str, repo_name: str, file_path: str, if_none_match: str = None) -> tuple:
+    """
+    Fetch a file via the GitHub contents API, through FILE_CONTENT_CACHE.
+    With nothing cached, the browser's If-None-Match is forwarded so an unchanged
+    file comes back as (304, None, etag, False). A file over FILE_CONTENT_MAX_BYTES is
+    returned cut at that size with truncated=True and is not cached.
+    """
+
+    api_url = f"https://api.github.com/repos/{owner}/{repo_name}/contents/{file_path}"
+    github_token = os.environ.get("GITHUB_TOKEN", "")
+    cache_key = (api_url, github_token)
+
+    entry = FILE_CONTENT_CACHE.get_entry(cache_key)
+    if entry and entry.fresh:
+        return 200, entry.value, entry.etag, False
+
+    # Raw media type: GitHub sends the file bytes, no JSON envelope or base64
+    headers = {"Accept": "application/vnd.github.v3.raw"}
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+    if entry and entry.etag:
+        headers["If-None-Match"] = entry.etag
+    elif if_none_match:
+        headers["If-None-Match"] = if_none_match
+
+    with HTTP_SESSION.get(api_url, headers=headers, stream=True, timeout=GITHUB_FILE_TIMEOUT) as resp:
+        if resp.status_code == 304:
+            if entry:
+                FILE_CONTENT_CACHE.touch(cache_key)
+                return 200, entry.value, entry.etag, False
+            return 304, None, resp.headers.get("ETag", if_none_match), False
+        if resp.status_code in (406, 415):
+            # Raw media type refused (406 Not Acceptable / 415): fall back to the JSON envelope + base64
+            return _fetch_github_file_base64(api_url, headers, cache_key)
+        if resp.status_code != 200:
+            return resp.status_code, None, None, False
+
+        body = bytearray()
+        truncated = False
+        for block in resp.iter_content(chunk_size=65536):
+            body += block
+            if len(body) > FILE_CONTENT_MAX_BYTES:
+                del body[FILE_CONTENT_MAX_BYTES:]
+                truncated = True
+                break
+
+    etag = resp.headers.get("ETag")
+    if truncated:
+        # The cut may split a UTF-8 sequence; the prefix is never cached as the file
+        return 200, body.decode("utf-8", errors="ignore"), etag, True
+    content = body.decode("utf-8", errors="replace")
+    FILE_CONTENT_CACHE.set(cache_key, content, etag)
+    return 200, content, etag, False
+
+
+def fetch_github_file_preview(owner: str, repo_name: str, file_path: str, max_bytes: int) -> tuple:
+    """
+    Fetch at most max_bytes of a file for a preview. Returns (status, content, truncated).
+
+    Cached full text is sliced locally; otherwise only the requested prefix is
+    downloaded with a Range request against raw.githubusercontent.com.
+    """
+    _, content = _cached_blob_content(owner, repo_name, file_path)
+    if content is None:
+        entry = FILE_CONTENT_CACHE.get_entry((f"https://api.github.com/repos/{owner}/{repo_name}/contents/{file_path}",
+                                              os.environ.get("GITHUB_TOKEN", "")))
+        if entry and entry.fresh:
+            content = entry.value
+    if content is not None:
+        data = content.encode("utf-8")
+        if len(data) <= max_bytes:
+            return 200, content, False
+        return 200, data[:max_bytes].decode("utf-8", errors="ignore"), True
+
+    raw_url = f"https://raw.githubusercontent.com/{owner}/{repo_name}/HEAD/{file_path}"
+    headers = {"Range": f"bytes=0-{max_bytes - 1}"}
+    github_token = os.environ.get("GITHUB_TOKEN", "")
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+
+    with HTTP_SESSION.get(raw_url, headers=headers, stream=True, timeout=GITHUB_FILE_TIMEOUT) as resp:
+        if resp.status_code == 416:
+            # Range not satisfiable: the file is empty
+            return 200, "", False
+        if resp.status_code not in (200, 206):
+            return resp.status_code, None, False
+
+        body = bytearray()
+        for block in resp.iter_content(chunk_size=65536):
+            body += block
+            if len(body) > max_bytes:
+                break
+
+    if resp.status_code == 206:
+        # Content-Range: bytes 0-262143/1048576
+        total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+        truncated = total.isdigit() and int(total) > max_bytes
+    else:
+        # Range ignored; we stopped reading one block past the limit
+        truncated = len(body) > max_bytes
+    del body[max_bytes:]
+    # "ignore" drops a multi-byte character split by the cut
+    return 200, body.decode("utf-8", errors="ignore" if truncated else "replace"), truncated
+
+
+# Outermost {...} of a Gemini JSON reply; skips markdown fences and any prose around them
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+# Static parts of the fallback analysis (shared across requests; the response is only serialized)
+_FALLBACK_WORKFLOW_TABLE = [
+    {"phase": "Phase 1 - Discovery", "task": "Deep Scan & Analysis", "description": "Scan all files, detect tech stack, identify dependencies", "duration": "Complete", "dependencies": "None", "status": "complete"},
+    {"phase": "Phase 2 - Planning", "task": "Migration Strategy", "description": "Define what to preserve, what to modernize, and migration order", "duration": "~5 min", "dependencies": "Phase 1", "status": "pending"},
+    {"phase": "Phase 3 - Backend", "task": "Backend Modernization", "description": "Upgrade backend framework while preserving API contracts", "duration": "~15 min", "dependencies": "Phase 2", "status": "pending"},
+    {"phase": "Phase 4 - Frontend", "task": "Frontend Rebuild", "description": "Modernize UI with component-based framework", "duration": "~15 min", "dependencies": "Phase 3", "status": "pending"},
+    {"phase": "Phase 5 - Testing", "task": "Sandbox Validation", "description": "Test all endpoints and UI in isolated sandbox", "duration": "~5 min", "dependencies": "Phase 4", "status": "pending"},
+    {"phase": "Phase 6 - Deploy", "task": "Create PR & Deploy", "description": "Commit changes and create pull request", "duration": "~2 min", "dependencies": "Phase 5", "status": "pending"},
+]
+_FALLBACK_WORKFLOW_STEPS = [
+    {"step": 1, "title": "Deep Scan", "description": "Analyze all files and dependencies", "status": "complete"},
+    {"step": 2, "title": "Plan Migration", "description": "Create preservation-first migration plan", "status": "pending"},
+    {"step": 3, "title": "Modernize Code", "description": "Upgrade tech stack while preserving functionality", "status": "pending"},
+    {"step": 4, "title": "Test & Validate", "description": "Run in sandbox to verify everything works", "status": "pending"},
+    {"step": 5, "title": "Deploy", "description": "Commit changes and create PR", "status": "pending"},
+]
+_FALLBACK_RISKS = ["Data loss if schemas are modified incorrectly", "API breaking changes"]
+
+
+def _fallback_recommendations(current_stack: dict, endpoint_count: int) -> dict:
+    """Heuristic analysis used when Gemini fails or returns unparseable JSON."""
+    return {
+        "summary": f"Repository uses {current_stack['backend_framework']} backend with {current_stack['database']} database and {current_stack['frontend_framework']} frontend. The codebase contains {current_stack['total_files']} files with {endpoint_count} API endpoints.",
+        "health_score": 50,
+        "project_understanding": {
+            "purpose": f"A web application using {current_stack['backend_framework']} for backend logic.",
+            "architecture": f"Backend: {current_stack['backend_framework']}, Frontend: {current_stack['frontend_framework'] or 'Not detected'}, Database: {current_stack['database']}.",
+            "data_flow": "Standard request-response pattern through API endpoints."
+        },
+        "drawbacks": [
+            {"id": "d1", "title": "Legacy Framework", "description": f"Using {current_stack['backend_framework']} which may lack modern async capabilities and community support.", "severity": "high", "category": "architecture"},
+            {"id": "d2", "title": "No Modern Frontend", "description": f"Frontend uses {current_stack['frontend_framework'] or 'basic HTML/JS'} without component-based architecture.", "severity": "medium", "category": "frontend"},
+            {"id": "d3", "title": "Security Review Needed", "description": f"Auth mechanism: {current_stack['auth']}. Needs evaluation for modern security standards.", "severity": "high", "category": "security"},
+        ],
+        "workflow_table": _FALLBACK_WORKFLOW_TABLE,
+        "recommendations": [
+            {"category": "Backend", "current": current_stack['backend_framework'], "recommended": "FastAPI / Next.js API Routes", "reason": "Modern async support, better performance", "priority": "high", "effort": "medium"},
+            {"category": "Frontend", "current": current_stack['frontend_framework'] or "Legacy HTML/JS", "recommended": "React / Next.js", "reason": "Component-based, SSR support", "priority": "high", "effort": "high"},
+            {"category": "Database", "current": current_stack['database'], "recommended": "Keep current + add Prisma ORM", "reason": "Type-safe queries, auto migrations", "priority": "medium", "effort": "medium"},
+        ],
+        "workflow_steps": _FALLBACK_WORKFLOW_STEPS,
+        "risks": _FALLBACK_RISKS,
+        "estimated_impact": "Significant performance and maintainability improvements"
+    }
+
+
+def _chunk_preview(chunk: dict, limit: int) -> str:
+    """Short preview of a stream chunk's payload for the debug log."""
+    content = chunk.get('content')
+    if isinstance(content, str):
+        return content[:limit]
+    data = chunk.get('data', '')
+    if isinstance(data, (dict, list)):
+        # Summarize instead of str()-ing a structure that may hold every generated file
+        return f"<{type(data).__name__} with {len(data)} items>"
+    return str(data)[:limit]
+
+
 class LazarusHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: complete responses carry Content-Length, so the browser's
+    # scan -> analyze -> resurrect -> commit sequence reuses one connection.
+    # Streamed responses have no length and close the connection to end the body.
+    protocol_version = 'HTTP/1.1'
+
+    # Larger read buffer for multi-MB create-pr bodies. wfile stays unbuffered
+    # (wbufsize = 0): NDJSONWriter may writev straight to the socket, which must
+    # never overtake response headers still sitting in a write buffer.
+    rbufsize = 64 * 1024
+
+    def setup(self):
+        """Disable Nagle so small NDJSON lines are not held back by delayed ACKs."""
+        try:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.request.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+        except OSError:
+            pass
+        super().setup()
+
+    def handle_one_request(self):
+        """
+        Wait at most KEEPALIVE_IDLE_TIMEOUT for the next request on a kept-alive
+        connection: an idle connection holds one of the pooled workers.
+        """
+        self._body_read = False
+        self.connection.settimeout(KEEPALIVE_IDLE_TIMEOUT)
+        super().handle_one_request()
+        # A POST answered without reading its body (/api/cache/clear, 404) leaves those
+        # bytes in front of the next request line: skip a small one, else drop the connection
+        if not self.close_connection and self.command == 'POST' and not self._body_read:
+            try:
+                pending = int(self.headers.get('Content-Length', ''))
+            except ValueError:
+                pending = -1
+            if 0 < pending <= _BODY_READ_CHUNK:
+                self.rfile.read(pending)
+            elif pending != 0:
+                self.close_connection = True
+
+    def parse_request(self):
+        ok = super().parse_request()
+        # Headers are in: a stalled body must still free the worker, so keep a read timeout
+        # until a streamed response starts
+        self.connection.settimeout(BODY_READ_TIMEOUT)
+        return ok
+
     def log_message(self, format, *args):
         """Override default logging to use our detailed logger."""
-        logger.info(f"HTTP {args[0]}" if args else format)
+        if args:
+            logger.info("HTTP %s", args[0])
+        else:
+            logger.info("%s", format)
+
+    def address_string(self):
+        """Client IP only - never resolve the peer's hostname while logging."""
+        return self.client_address[0]
 
     def _log_request_start(self, method: str):
         """Log incoming request with full details."""
@@ -104,27 +847,113 @@ class LazarusHandler(BaseHTTPRequestHandler):
         })
 
     def _log_error(self, error: Exception, context: str = ''):
-        """Log errors with full traceback."""
-        tb = traceback.format_exc()
+        """Log errors with full traceback (formatted only where it is actually output)."""
+        tb = LazyTraceback(error)
         logger.error(f"❌ ERROR in {context}: {error}")
-        logger.debug(f"   Traceback:\n{tb}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   Traceback:\n%s", tb)
         add_debug_log('ERROR', 'EXCEPTION', str(error), {
             'context': context,
             'traceback': tb,
             'error_type': type(error).__name__,
         })
 
+    def _send_fast(self, status: int, headers_blob: bytes, body: bytes = None):
+        """
+        Write the status line and a precomputed header block in a single write,
+        skipping send_header's per-call formatting. With body=None the headers are
+        terminated and the caller streams the body itself.
+        """
+        status_line = _STATUS_LINES.get(status)
+        if status_line is None:
+            reason = self.responses.get(status, ('',))[0]
+            status_line = _STATUS_LINES[status] = f"{self.protocol_version} {status} {reason}\r\n".encode('latin-1')
+        self.log_request(status)
+        if body is None:
+            self.close_connection = True  # unframed streamed body: the close marks its end
+            self.wfile.write(status_line + headers_blob + b"\r\n")
+        else:
+            self.wfile.write(b"%s%sContent-Length: %d\r\n\r\n%s" % (status_line, headers_blob, len(body), body))
+
+    def _send_json(self, status: int, payload, extra_headers: bytes = b"") -> bytes:
+        """
+        Send payload as a complete JSON response; returns the body as sent.
+        Large bodies (scan file lists, file contents, debug logs) are gzipped at
+        level 1 when the client sends Accept-Encoding: gzip.
+        """
+        return self._send_json_body(status, json_bytes(payload), extra_headers)
+
+    def _send_json_body(self, status: int, body: bytes, extra_headers: bytes = b"") -> bytes:
+        """Send an already-serialized JSON body (gzipped under the same rule as _send_json)."""
+        if len(body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self._send_fast(status, _JSON_GZIP_HEADERS + extra_headers, body)
+        else:
+            self._send_fast(status, _JSON_CORS_HEADERS + extra_headers, body)
+        return body
+
+    def _stream_format(self) -> tuple:
+        """
+        (header block, encoder, compress) for a streamed response, negotiated from the
+        Accept and Accept-Encoding headers.
+        """
+        if MSGPACK_AVAILABLE and MSGPACK_STREAM_TYPE in self.headers.get('Accept', ''):
+            headers, encode = _MSGPACK_STREAM_CORS_HEADERS, msgpack_frame
+        else:
+            headers, encode = _NDJSON_CORS_HEADERS, ndjson_line
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            return headers + _GZIP_ENCODING_HEADERS, encode, True
+        return headers, encode, False
+
+    def _read_body(self):
+        """
+        Read the POST body in 64KB chunks into a buffer sized from Content-Length.
+        Returns a memoryview over the body, or None after answering 408/411/413.
+        Bodies up to _BODY_REUSE_MAX land in a per-thread buffer that the next
+        request on this thread overwrites, so parse the view before returning.
+        """
+        try:
+            content_length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.close_connection = True
+            self._send_json(411, {"error": "Content-Length required"}, _CONNECTION_CLOSE_HEADER)
+            return None
+        if content_length < 0 or content_length > MAX_BODY:
+            logger.warning(f"⚠ Rejected POST body of {content_length} bytes (limit {MAX_BODY})")
+            # The unread body is still on the socket, so this connection ends here
+            self.close_connection = True
+            self._send_json(413, {"error": f"Request body too large (limit {MAX_BODY} bytes)"}, _CONNECTION_CLOSE_HEADER)
+            return None
+
+        self._body_read = True
+        if content_length <= _BODY_REUSE_MAX:
+            # Per-thread scratch buffer: typical resurrect/commit bodies allocate nothing
+            buf = getattr(_body_buffers, 'buf', None)
+            if buf is None:
+                buf = _body_buffers.buf = bytearray(_BODY_REUSE_MAX)
+            view = memoryview(buf)[:content_length]
+        else:
+            view = memoryview(bytearray(content_length))
+        received = 0
+        try:
+            while received < content_length:
+                n = self.rfile.readinto(view[received:received + _BODY_READ_CHUNK])
+                if not n:
+                    break  # Client closed early; parse whatever arrived
+                received += n
+        except socket.timeout:
+            logger.warning(f"⚠ Client stalled after {received}/{content_length} body bytes")
+            self.close_connection = True
+            self._send_json(408, {"error": "Timed out reading request body"}, _CONNECTION_CLOSE_HEADER)
+            return None
+        return view[:received]
+
     def do_OPTIONS(self):
         self._log_request_start('OPTIONS')
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        self._send_fast(200, _PREFLIGHT_HEADERS, b"")
         self._log_response(200)
 
     def do_GET(self):
-        from urllib.parse import urlparse, parse_qs
         parsed = urlparse(self.path)
         params = parse_qs(parsed.query)
         self._log_request_start('GET')
@@ -134,21 +963,14 @@ class LazarusHandler(BaseHTTPRequestHandler):
         if parsed.path == '/api/debug-logs':
             try:
                 since = float(params.get('since', ['0'])[0])
-                with debug_log_lock:
-                    logs = [e for e in debug_log_buffer if e['timestamp'] > since]
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response_data = json.dumps({"logs": logs, "server_time": time.time()})
-                self.wfile.write(response_data.encode())
+                logs = debug_log_buffer.since(since)
+                # Entries are stored as JSON bytes: the body is a join, no per-poll encoding
+                self._send_json_body(200, b"".join((
+                    b'{"logs":[', b",".join(logs), b'],"server_time":', b"%r" % time.time(), b"}"
+                )))
             except Exception as e:
                 self._log_error(e, '/api/debug-logs')
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self._send_json(500, {"error": str(e)})
             return
 
         if parsed.path == '/api/scan':
@@ -158,35 +980,22 @@ class LazarusHandler(BaseHTTPRequestHandler):
                 add_debug_log('INFO', 'SCAN', f'Repository scan started', {'repo_url': repo_url})
 
                 if not repo_url:
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing repo_url"}).encode())
+                    self._send_json(400, {"error": "Missing repo_url"})
                     self._log_response(400, extra='Missing repo_url')
                     return
 
-                agent = LazarusEngine()
+                agent = engine
                 files = agent.scan_repository(repo_url)
                 elapsed = time.time() - request_start
 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response_data = json.dumps({"files": files})
-                self.wfile.write(response_data.encode())
+                response_data = self._send_json(200, {"files": files})
                 logger.info(f"✅ Scan complete: {len(files)} files found in {elapsed:.2f}s")
                 add_debug_log('INFO', 'SCAN', f'Scan complete: {len(files)} files', {'file_count': len(files), 'elapsed_ms': round(elapsed * 1000)})
                 self._log_response(200, len(response_data), f'| {len(files)} files | {elapsed:.2f}s')
 
             except Exception as e:
                 self._log_error(e, '/api/scan')
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self._send_json(500, {"error": str(e)})
                 self._log_response(500, extra=str(e))
 
         elif parsed.path == '/api/analyze':
@@ -196,50 +1005,57 @@ class LazarusHandler(BaseHTTPRequestHandler):
                 add_debug_log('INFO', 'ANALYZE', 'Deep analysis started', {'repo_url': repo_url})
 
                 if not repo_url:
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing repo_url"}).encode())
+                    self._send_json(400, {"error": "Missing repo_url"})
                     self._log_response(400, extra='Missing repo_url')
                     return
 
                 # Use NDJSON streaming for real-time updates
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/x-ndjson')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Cache-Control', 'no-cache')
-                self.send_header('Connection', 'keep-alive')
-                self.end_headers()
+                stream_headers, encode, compress = self._stream_format()
+                # Long-running stream: only the body read needed the timeout
+                self.connection.settimeout(None)
+                self._send_fast(200, stream_headers)
+                writer = NDJSONWriter(self.wfile, self.connection, encode=encode, compress=compress)
 
                 chunk_count = 0
                 def send_chunk(chunk):
                     nonlocal chunk_count
                     chunk_count += 1
-                    line = json.dumps(chunk) + "\n"
-                    self.wfile.write(line.encode('utf-8'))
-                    self.wfile.flush()
-                    # Log every chunk sent
-                    logger.debug(f"   📤 Stream chunk #{chunk_count}: type={chunk.get('type', '?')} | size={len(line)} bytes")
-                    add_debug_log('DEBUG', 'STREAM_CHUNK', f'Chunk #{chunk_count} sent', {
-                        'chunk_type': chunk.get('type', 'unknown'),
-                        'chunk_size': len(line),
-                        'content_preview': str(chunk.get('content', chunk.get('data', '')))[:200]
-                    })
+                    line = writer.write(chunk)
+                    if VERBOSE_STREAM:
+                        # Log every chunk sent
+                        logger.debug(f"   📤 Stream chunk #{chunk_count}: type={chunk.get('type', '?')} | size={len(line)} bytes")
+                        add_debug_log('DEBUG', 'STREAM_CHUNK', f'Chunk #{chunk_count} sent', {
+                            'chunk_type': chunk.get('type', 'unknown'),
+                            'chunk_size': len(line),
+                            'content_preview': _chunk_preview(chunk, 200)
+                        })
 
                 send_chunk({"type": "log", "content": "Initializing deep scan engine..."})
 
-                agent = LazarusEngine()
+                agent = engine
 
                 # Step 1: Get file list
                 send_chunk({"type": "log", "content": "Fetching repository structure..."})
-                files = agent.scan_repository(repo_url)
-                send_chunk({"type": "files", "data": files})
-                send_chunk({"type": "log", "content": f"Found {len(files)} files in repository"})
-
-                # Step 2: Deep scan to detect tech stack
-                send_chunk({"type": "log", "content": "Running deep analysis on codebase..."})
-                deep = agent.scan_repository_deep(repo_url)
+                if ANALYZE_PARALLEL_SCANS:
+                    # Both scans are GitHub-bound; start the deep scan now and stream the
+                    # file tree as soon as it arrives
+                    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='lazarus-analyze') as pool:
+                        deep_future = pool.submit(agent.scan_repository_deep, repo_url)
+                        files = agent.scan_repository(repo_url)
+                        send_chunk({"type": "files", "data": files})
+                        send_chunk({"type": "log", "content": f"Found {len(files)} files in repository"})
+
+                        # Step 2: Deep scan to detect tech stack
+                        send_chunk({"type": "log", "content": "Running deep analysis on codebase..."})
+                        deep = deep_future.result()
+                else:
+                    files = agent.scan_repository(repo_url)
+                    send_chunk({"type": "files", "data": files})
+                    send_chunk({"type": "log", "content": f"Found {len(files)} files in repository"})
+
+                    # Step 2: Deep scan to detect tech stack
+                    send_chunk({"type": "log", "content": "Running deep analysis on codebase..."})
+                    deep = agent.scan_repository_deep(repo_url)
                 tech_stack = deep.get("tech_stack", {})
                 must_preserve = deep.get("must_preserve", [])
                 can_modernize = deep.get("can_modernize", [])
@@ -248,6 +1064,8 @@ class LazarusHandler(BaseHTTPRequestHandler):
                 db_schemas = deep.get("database_schemas", [])
                 total_files_scanned = len(deep.get("files", []))
 
+                if deep.get("from_cache"):
+                    send_chunk({"type": "log", "content": "Deep scan cache hit - repository unchanged since last scan"})
                 send_chunk({"type": "log", "content": f"Deep scanned {total_files_scanned} code files"})
 
                 # Build current stack info
@@ -260,7 +1078,7 @@ class LazarusHandler(BaseHTTPRequestHandler):
                     "total_files": len(files),
                     "code_files_scanned": total_files_scanned,
                     "api_endpoints": api_endpoints[:20],
-                    "env_vars": list(set(env_vars))[:15],
+                    "env_vars": env_vars[:15],
                     "database_schemas": db_schemas[:10],
                     "must_preserve": must_preserve[:15],
                     "can_modernize": can_modernize[:15],
@@ -269,136 +1087,44 @@ class LazarusHandler(BaseHTTPRequestHandler):
                 send_chunk({"type": "log", "content": "Detected tech stack, generating recommendations..."})
 
                 # Step 3: Use Gemini to get upgrade recommendations
-                analysis_prompt = f"""Analyze this legacy repository tech stack and provide a comprehensive project understanding and modernization plan.
-
-CURRENT TECH STACK DETECTED:
-- Backend Framework: {current_stack['backend_framework']}
-- Database: {current_stack['database']}
-- Authentication: {current_stack['auth']}
-- Frontend Framework: {current_stack['frontend_framework']}
-- Frontend Styling: {current_stack['frontend_styling']}
-- Total Files: {current_stack['total_files']}
-- API Endpoints Found: {len(api_endpoints)}
-- Database Schemas: {len(db_schemas)}
-
-API ENDPOINTS: {json.dumps(api_endpoints[:10])}
-MUST PRESERVE: {json.dumps(must_preserve[:10])}
-CAN MODERNIZE: {json.dumps(can_modernize[:10])}
-
-Respond in this EXACT JSON format (no markdown, no code blocks, just raw JSON):
-{{
-  "summary": "A 3-4 sentence narrative explaining what this project does, how it's structured, and what its purpose is. Write it like you're explaining the project to someone who has never seen it.",
-  "health_score": 65,
-  "project_understanding": {{
-    "purpose": "What the project is built for (1-2 sentences)",
-    "architecture": "How the codebase is organized (1-2 sentences)",
-    "data_flow": "How data moves through the system (1-2 sentences)"
-  }},
-  "drawbacks": [
-    {{
-      "id": "d1",
-      "title": "Short title of the issue",
-      "description": "Detailed explanation of why this is a problem",
-      "severity": "critical",
-      "category": "security"
-    }}
-  ],
-  "workflow_table": [
-    {{
-      "phase": "Phase 1 - Analysis",
-      "task": "Task name",
-      "description": "What this task involves",
-      "duration": "2 hours",
-      "dependencies": "None",
-      "status": "complete"
-    }}
-  ],
-  "recommendations": [
-    {{
-      "category": "Backend",
-      "current": "Current tech",
-      "recommended": "New tech",
-      "reason": "Why upgrade",
-      "priority": "high",
-      "effort": "medium"
-    }}
-  ],
-  "workflow_steps": [
-    {{
-      "step": 1,
-      "title": "Step title",
-      "description": "What happens in this step",
-      "status": "pending"
-    }}
-  ],
-  "risks": ["Risk 1", "Risk 2"],
-  "estimated_impact": "Impact description"
-}}"""
+                analysis_prompt = get_analysis_prompt(current_stack, api_endpoints, db_schemas, must_preserve, can_modernize)
+
+                # Same prompt (same stack summary) within LLM_CACHE_TTL -> reuse the parsed-OK response
+                prompt_sha = hashlib.sha256(analysis_prompt.encode('utf-8')).digest()
+                cleaned = get_cached_llm(prompt_sha)
+                llm_cache_hit = cleaned is not None
 
                 try:
-                    logger.info("🤖 Calling Gemini API for analysis recommendations...")
-                    add_debug_log('INFO', 'GEMINI_API', 'Calling Gemini for analysis', {'prompt_length': len(analysis_prompt)})
-                    gemini_start = time.time()
-
-                    gemini_resp = agent._call_gemini(analysis_prompt)
-                    gemini_elapsed = time.time() - gemini_start
-                    logger.info(f"🤖 Gemini responded in {gemini_elapsed:.2f}s | Response length: {len(gemini_resp)} chars")
-                    add_debug_log('INFO', 'GEMINI_API', f'Gemini response received', {
-                        'elapsed_ms': round(gemini_elapsed * 1000),
-                        'response_length': len(gemini_resp),
-                        'response_preview': gemini_resp[:300]
-                    })
-
-                    # Clean response - remove markdown code blocks if present
-                    cleaned = gemini_resp.strip()
-                    if cleaned.startswith('```'):
-                        cleaned = cleaned.split('\n', 1)[1] if '\n' in cleaned else cleaned[3:]
-                    if cleaned.endswith('```'):
-                        cleaned = cleaned[:-3]
-                    cleaned = cleaned.strip()
-
-                    recommendations = json.loads(cleaned)
+                    if llm_cache_hit:
+                        logger.info("🤖 Gemini analysis served from cache")
+                        send_chunk({"type": "log", "content": "LLM cache hit - reusing previous analysis"})
+                    else:
+                        logger.info("🤖 Calling Gemini API for analysis recommendations...")
+                        add_debug_log('INFO', 'GEMINI_API', 'Calling Gemini for analysis', {'prompt_length': len(analysis_prompt)})
+                        gemini_start = time.time()
+
+                        gemini_resp = agent._call_gemini(analysis_prompt)
+                        gemini_elapsed = time.time() - gemini_start
+                        logger.info(f"🤖 Gemini responded in {gemini_elapsed:.2f}s | Response length: {len(gemini_resp)} chars")
+                        add_debug_log('INFO', 'GEMINI_API', f'Gemini response received', {
+                            'elapsed_ms': round(gemini_elapsed * 1000),
+                            'response_length': len(gemini_resp),
+                            'response_preview': gemini_resp[:300]
+                        })
+
+                        # Clean response - keep only the JSON object (drops code fences / stray text)
+                        match = _JSON_OBJECT_RE.search(gemini_resp)
+                        cleaned = match.group(0) if match else gemini_resp.strip()
+
+                    recommendations = json_loads(cleaned)
+                    if not llm_cache_hit:
+                        put_cached_llm(prompt_sha, cleaned)
                     logger.info(f"✅ Analysis JSON parsed successfully. Keys: {list(recommendations.keys())}")
                     add_debug_log('INFO', 'ANALYZE', 'Analysis JSON parsed', {'keys': list(recommendations.keys())})
                 except Exception as e:
                     logger.error(f"❌ Gemini analysis error: {e}")
-                    add_debug_log('ERROR', 'GEMINI_API', f'Gemini analysis failed: {e}', {'traceback': traceback.format_exc()})
-                    recommendations = {
-                        "summary": f"Repository uses {current_stack['backend_framework']} backend with {current_stack['database']} database and {current_stack['frontend_framework']} frontend. The codebase contains {current_stack['total_files']} files with {len(api_endpoints)} API endpoints.",
-                        "health_score": 50,
-                        "project_understanding": {
-                            "purpose": f"A web application using {current_stack['backend_framework']} for backend logic.",
-                            "architecture": f"Backend: {current_stack['backend_framework']}, Frontend: {current_stack['frontend_framework'] or 'Not detected'}, Database: {current_stack['database']}.",
-                            "data_flow": "Standard request-response pattern through API endpoints."
-                        },
-                        "drawbacks": [
-                            {"id": "d1", "title": "Legacy Framework", "description": f"Using {current_stack['backend_framework']} which may lack modern async capabilities and community support.", "severity": "high", "category": "architecture"},
-                            {"id": "d2", "title": "No Modern Frontend", "description": f"Frontend uses {current_stack['frontend_framework'] or 'basic HTML/JS'} without component-based architecture.", "severity": "medium", "category": "frontend"},
-                            {"id": "d3", "title": "Security Review Needed", "description": f"Auth mechanism: {current_stack['auth']}. Needs evaluation for modern security standards.", "severity": "high", "category": "security"},
-                        ],
-                        "workflow_table": [
-                            {"phase": "Phase 1 - Discovery", "task": "Deep Scan & Analysis", "description": "Scan all files, detect tech stack, identify dependencies", "duration": "Complete", "dependencies": "None", "status": "complete"},
-                            {"phase": "Phase 2 - Planning", "task": "Migration Strategy", "description": "Define what to preserve, what to modernize, and migration order", "duration": "~5 min", "dependencies": "Phase 1", "status": "pending"},
-                            {"phase": "Phase 3 - Backend", "task": "Backend Modernization", "description": "Upgrade backend framework while preserving API contracts", "duration": "~15 min", "dependencies": "Phase 2", "status": "pending"},
-                            {"phase": "Phase 4 - Frontend", "task": "Frontend Rebuild", "description": "Modernize UI with component-based framework", "duration": "~15 min", "dependencies": "Phase 3", "status": "pending"},
-                            {"phase": "Phase 5 - Testing", "task": "Sandbox Validation", "description": "Test all endpoints and UI in isolated sandbox", "duration": "~5 min", "dependencies": "Phase 4", "status": "pending"},
-                            {"phase": "Phase 6 - Deploy", "task": "Create PR & Deploy", "description": "Commit changes and create pull request", "duration": "~2 min", "dependencies": "Phase 5", "status": "pending"},
-                        ],
-                        "recommendations": [
-                            {"category": "Backend", "current": current_stack['backend_framework'], "recommended": "FastAPI / Next.js API Routes", "reason": "Modern async support, better performance", "priority": "high", "effort": "medium"},
-                            {"category": "Frontend", "current": current_stack['frontend_framework'] or "Legacy HTML/JS", "recommended": "React / Next.js", "reason": "Component-based, SSR support", "priority": "high", "effort": "high"},
-                            {"category": "Database", "current": current_stack['database'], "recommended": "Keep current + add Prisma ORM", "reason": "Type-safe queries, auto migrations", "priority": "medium", "effort": "medium"},
-                        ],
-                        "workflow_steps": [
-                            {"step": 1, "title": "Deep Scan", "description": "Analyze all files and dependencies", "status": "complete"},
-                            {"step": 2, "title": "Plan Migration", "description": "Create preservation-first migration plan", "status": "pending"},
-                            {"step": 3, "title": "Modernize Code", "description": "Upgrade tech stack while preserving functionality", "status": "pending"},
-                            {"step": 4, "title": "Test & Validate", "description": "Run in sandbox to verify everything works", "status": "pending"},
-                            {"step": 5, "title": "Deploy", "description": "Commit changes and create PR", "status": "pending"},
-                        ],
-                        "risks": ["Data loss if schemas are modified incorrectly", "API breaking changes"],
-                        "estimated_impact": "Significant performance and maintainability improvements"
-                    }
+                    add_debug_log('ERROR', 'GEMINI_API', f'Gemini analysis failed: {e}', {'traceback': LazyTraceback(e)})
+                    recommendations = _fallback_recommendations(current_stack, len(api_endpoints))
 
                 elapsed = time.time() - request_start
                 send_chunk({"type": "log", "content": f"Analysis complete! ({elapsed:.1f}s)"})
@@ -413,87 +1139,88 @@ Respond in this EXACT JSON format (no markdown, no code blocks, just raw JSON):
                         "recommendations": recommendations,
                     }
                 })
+                writer.close()
 
             except Exception as e:
                 self._log_error(e, '/api/analyze')
                 try:
                     # Try sending error as a chunk (headers may already be sent)
-                    error_line = json.dumps({"type": "error", "content": str(e)}) + "\n"
-                    self.wfile.write(error_line.encode('utf-8'))
-                    self.wfile.flush()
+                    writer.write({"type": "error", "content": str(e)})
+                    writer.close()
                 except Exception:
                     # Headers not yet sent, send normal error response
                     try:
-                        self.send_response(500)
-                        self.send_header('Content-type', 'application/json')
-                        self.send_header('Access-Control-Allow-Origin', '*')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({"error": str(e)}).encode())
+                        self._send_json(500, {"error": str(e)})
                     except Exception:
                         pass
 
         elif parsed.path == '/api/file-content':
             try:
-                import re, requests, base64, os
                 repo_url = params.get('repo_url', [None])[0]
                 file_path = params.get('path', [None])[0]
 
                 if not repo_url or not file_path:
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing repo_url or path"}).encode())
+                    self._send_json(400, {"error": "Missing repo_url or path"})
                     return
 
-                match = re.search(r"github\.com/([^/]+)/([^/.]+)", repo_url)
+                match = GITHUB_URL_RE.search(repo_url)
                 if not match:
-                    raise ValueError("Invalid GitHub URL")
+                    self._send_json(400, {"error": "Invalid GitHub URL"})
+                    return
 
                 owner, repo_name = match.groups()
-                headers = {"Accept": "application/vnd.github.v3+json"}
-                github_token = os.environ.get("GITHUB_TOKEN", "")
-                if github_token:
-                    headers["Authorization"] = f"token {github_token}"
 
-                api_url = f"https://api.github.com/repos/{owner}/{repo_name}/contents/{file_path}"
-                resp = requests.get(api_url, headers=headers)
-
-                if resp.status_code != 200:
-                    raise ValueError(f"GitHub API error: {resp.status_code}")
+                max_bytes = params.get('max_bytes', [None])[0]
+                if max_bytes is not None:
+                    # Preview: only the first max_bytes of the file, no ETag handling
+                    if not max_bytes.isdigit() or int(max_bytes) == 0:
+                        self._send_json(400, {"error": "max_bytes must be a positive integer"})
+                        return
+                    max_bytes = min(int(max_bytes), FILE_CONTENT_MAX_BYTES)
+                    status, content, truncated = fetch_github_file_preview(owner, repo_name, file_path, max_bytes)
+                    if status != 200:
+                        self._send_json(status, {"error": f"GitHub API error: {status}"})
+                        return
+                    self._send_json(200, {"content": content, "path": file_path, "truncated": truncated})
+                    return
 
-                data = resp.json()
-                content = base64.b64decode(data.get("content", "")).decode("utf-8", errors="replace")
+                if_none_match = self.headers.get('If-None-Match')
+                status, content, etag, truncated = fetch_github_file(owner, repo_name, file_path, if_none_match)
+                etag_header = f"ETag: {etag}\r\n".encode('latin-1') if etag else b""
+                if status == 304 or (etag and if_none_match == etag):
+                    # Browser already has this version - no body, no JSON encode
+                    self._send_fast(304, _JSON_CORS_HEADERS + etag_header, b"")
+                    return
+                if status != 200:
+                    # Pass GitHub's status straight through (404, 403, ...)
+                    self._send_json(status, {"error": f"GitHub API error: {status}"})
+                    return
 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"content": content, "path": file_path}).encode())
+                self._send_json(200, {"content": content, "path": file_path, "truncated": truncated}, etag_header)
 
             except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self._send_json(500, {"error": str(e)})
 
         else:
-            self.send_response(404)
-            self.end_headers()
+            self._send_fast(404, _NOT_FOUND_HEADERS, b"")
 
     def do_POST(self):
         self._log_request_start('POST')
         request_start = time.time()
 
         if self.path == '/api/resurrect':
+            stream_headers, encode, compress = self._stream_format()
+            writer = NDJSONWriter(self.wfile, self.connection, encode=encode, compress=compress)
             try:
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                request_json = json.loads(post_data)
+                post_data = self._read_body()
+                if post_data is None:
+                    return
+                request_json = json_loads(post_data)
                 
                 repo_url = request_json.get('repo_url')
                 vibe_instructions = request_json.get('vibe_instructions')
+                # "force": true regenerates even when Gemini has answered this exact prompt before
+                use_llm_cache = not request_json.get('force')
 
                 logger.info(f"🧬 RESURRECTION STARTED for: {repo_url}")
                 logger.info(f"   Instructions: {(vibe_instructions or 'None')[:200]}")
@@ -503,39 +1230,55 @@ Respond in this EXACT JSON format (no markdown, no code blocks, just raw JSON):
                     'instructions_preview': (vibe_instructions or '')[:500],
                 })
 
-                self.send_response(200)
-                # Use NDJSON (Newline Delimited JSON) for easy parsing
-                self.send_header('Content-Type', 'application/x-ndjson')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                # Disable buffering
-                self.send_header('Cache-Control', 'no-cache')
-                self.send_header('Connection', 'keep-alive')
-                self.end_headers()
+                # Long-running stream: only the body read needed the timeout
+                self.connection.settimeout(None)
+                # Use NDJSON (Newline Delimited JSON) for easy parsing, no-cache to disable buffering
+                self._send_fast(200, stream_headers)
+
+                # At most JOB_WORKERS resurrections run at once; later ones wait here
+                # (with a visible log line) instead of piling onto Gemini/E2B quota
+                if not RESURRECT_SLOTS.acquire(blocking=False):
+                    logger.info(f"   ⏳ All {JOB_WORKERS} resurrection slots busy - queued")
+                    writer.write({"type": "log", "content": "Server busy - waiting for a free resurrection slot..."})
+                    writer.flush()
+                    if not RESURRECT_SLOTS.acquire(timeout=RESURRECT_QUEUE_TIMEOUT):
+                        raise RuntimeError(f"Server busy: no resurrection slot freed up within {RESURRECT_QUEUE_TIMEOUT}s")
 
                 # Call the generator with detailed logging
                 chunk_count = 0
-                for chunk in process_resurrection(repo_url, vibe_instructions):
-                    chunk_count += 1
-                    # Write chunk as JSON line + newline
-                    line = json.dumps(chunk) + "\n"
-                    self.wfile.write(line.encode('utf-8'))
-                    self.wfile.flush()
-
-                    chunk_type = chunk.get('type', 'unknown')
-                    if chunk_type == 'log':
-                        logger.info(f"   📤 Stream log: {chunk.get('content', '')[:120]}")
-                    elif chunk_type == 'debug':
-                        logger.debug(f"   🔍 Debug: {chunk.get('content', '')[:200]}")
-                    elif chunk_type == 'result':
-                        result_data = chunk.get('data', {})
-                        logger.info(f"   📦 Result: status={result_data.get('status')} | artifacts={len(result_data.get('artifacts', []))} | retries={result_data.get('retry_count', 0)}")
+                chunks = None
+                try:
+                    # The slot goes back when the job worker finishes, not when this handler
+                    # exits: a disconnected client's job still holds its worker until then
+                    chunks = iter_in_background(process_resurrection(repo_url, vibe_instructions, use_llm_cache),
+                                                on_done=RESURRECT_SLOTS.release)
+                    for chunk in chunks:
+                        chunk_count += 1
+                        # Buffered: flushed at 16KB, after 50ms, or on a result chunk
+                        line = writer.write(chunk)
+
+                        chunk_type = chunk.get('type', 'unknown')
+                        if chunk_type == 'log':
+                            logger.info(f"   📤 Stream log: {chunk.get('content', '')[:120]}")
+                        elif chunk_type == 'debug' and VERBOSE_STREAM:
+                            logger.debug(f"   🔍 Debug: {chunk.get('content', '')[:200]}")
+                        elif chunk_type == 'result':
+                            result_data = chunk.get('data', {})
+                            logger.info(f"   📦 Result: status={result_data.get('status')} | artifacts={len(result_data.get('artifacts', []))} | retries={result_data.get('retry_count', 0)}")
                     
-                    add_debug_log('DEBUG', 'RESURRECT_STREAM', f'Chunk #{chunk_count}: {chunk_type}', {
-                        'chunk_type': chunk_type,
-                        'chunk_size': len(line),
-                        'content_preview': str(chunk.get('content', chunk.get('data', '')))[:300]
-                    })
-
+                        if VERBOSE_STREAM:
+                            add_debug_log('DEBUG', 'RESURRECT_STREAM', f'Chunk #{chunk_count}: {chunk_type}', {
+                                'chunk_type': chunk_type,
+                                'chunk_size': len(line),
+                                'content_preview': _chunk_preview(chunk, 300)
+                            })
+                finally:
+                    if chunks is not None:
+                        chunks.close()  # stops the producer if the client went away
+                    else:
+                        RESURRECT_SLOTS.release()  # the job never started
+
+                writer.close()
                 elapsed = time.time() - request_start
                 logger.info(f"🏁 RESURRECTION COMPLETE in {elapsed:.1f}s | {chunk_count} chunks streamed")
                 add_debug_log('INFO', 'RESURRECT', f'Resurrection complete', {'elapsed_ms': round(elapsed * 1000), 'chunks': chunk_count})
@@ -543,21 +1286,19 @@ Respond in this EXACT JSON format (no markdown, no code blocks, just raw JSON):
             except Exception as e:
                 self._log_error(e, '/api/resurrect')
                 try:
-                    error_line = json.dumps({"type": "log", "content": f"[ERROR] {str(e)}"}) + "\n"
-                    self.wfile.write(error_line.encode('utf-8'))
-                    self.wfile.flush()
+                    writer.write({"type": "log", "content": f"[ERROR] {str(e)}"})
                     # Send a result with error status so frontend can exit loading state
-                    result_line = json.dumps({"type": "result", "data": {"logs": str(e), "artifacts": [], "preview": "", "status": "Error", "retry_count": 0, "errors": [{"attempt": 1, "type": "EXCEPTION", "message": str(e)}]}}) + "\n"
-                    self.wfile.write(result_line.encode('utf-8'))
-                    self.wfile.flush()
+                    writer.write({"type": "result", "data": {"logs": str(e), "artifacts": [], "preview": "", "status": "Error", "retry_count": 0, "errors": [{"attempt": 1, "type": "EXCEPTION", "message": str(e)}]}})
+                    writer.close()
                 except Exception:
                     pass
 
         elif self.path == '/api/commit':
             try:
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                request_json = json.loads(post_data)
+                post_data = self._read_body()
+                if post_data is None:
+                    return
+                request_json = json_loads(post_data)
                 
                 repo_url = request_json.get('repo_url')
                 filename = request_json.get('filename')
@@ -572,72 +1313,90 @@ Respond in this EXACT JSON format (no markdown, no code blocks, just raw JSON):
                 logger.info(f"   Commit result: {result.get('status', 'unknown')}")
                 add_debug_log('INFO', 'COMMIT', f'Commit result: {result.get("status")}', result)
 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
+                self._send_json(200, result)
                 self._log_response(200)
 
             except Exception as e:
                 self._log_error(e, '/api/commit')
-                self.send_error(500, str(e))
+                self._send_json(500, {"status": "error", "message": str(e)})
         
         elif self.path == '/api/create-pr':
             try:
-                from lazarus_agent import commit_all_files
-                
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                request_json = json.loads(post_data)
+                post_data = self._read_body()
+                if post_data is None:
+                    return
+                request_json = json_loads(post_data)
+                # Large bodies get a one-off buffer; drop it now rather than holding the raw
+                # bytes next to the parsed files for the whole GitHub round trip
+                post_data.release()
+                del post_data
                 
                 repo_url = request_json.get('repo_url')
                 files = request_json.get('files')  # list of {"filename": str, "content": str}
                 
                 if not files or not repo_url:
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"status": "error", "message": "Missing repo_url or files"}).encode())
+                    self._send_json(400, {"status": "error", "message": "Missing repo_url or files"})
                     return
 
-                # Commit all files and create PR
-                result = commit_all_files(repo_url, files)
+                # Same repo + same files within PR_RESULT_CACHE's TTL: return the earlier PR
+                # ("force": true in the body skips the lookup)
+                pr_key = _pr_request_key(repo_url, files)
+                if not request_json.get('force'):
+                    cached = PR_RESULT_CACHE.get(pr_key)
+                    if cached is not None:
+                        add_debug_log('INFO', 'CREATE_PR', 'Create-PR cache hit', {'repo_url': repo_url, 'files': len(files)})
+                        self._send_json(200, cached, _PR_CACHE_HIT_HEADERS)
+                        return
+
+                # Commit all files and create PR; transient GitHub failures are retried
+                # (X-Lazarus-Retry-Attempts overrides the count, capped at PR_MAX_RETRY_ATTEMPTS)
+                try:
+                    attempts = int(self.headers.get('X-Lazarus-Retry-Attempts', PR_RETRY_ATTEMPTS))
+                except ValueError:
+                    attempts = PR_RETRY_ATTEMPTS
+                result = commit_all_files(repo_url, files, attempts=min(max(attempts, 1), PR_MAX_RETRY_ATTEMPTS))
+                if result.get('status') != 'error':
+                    PR_RESULT_CACHE.set(pr_key, result)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
+                self._send_json(200, result, _PR_CACHE_MISS_HEADERS)
 
             except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "error", "message": str(e)}).encode())
+                self._send_json(500, {"status": "error", "message": str(e)})
+
+        elif self.path == '/api/cache/clear':
+            # Drop the in-process caches (the SQLite scan cache is keyed by commit SHA and left alone)
+            for cache in (SCAN_CACHE, BLOB_SHA_CACHE, FILE_CONTENT_CACHE, BLOB_CONTENT_CACHE, PR_RESULT_CACHE):
+                cache.clear()
+            add_debug_log('INFO', 'CACHE', 'In-process caches cleared')
+            self._send_json(200, {"status": "ok"})
         
         else:
-            self.send_response(404)
-            self.end_headers()
+            self._send_fast(404, _NOT_FOUND_HEADERS, b"")
 
-def run(server_class=ThreadingHTTPServer, handler_class=LazarusHandler, port=PORT):
+def run(server_class=PooledHTTPServer, handler_class=LazarusHandler, port=PORT, http_threads=HTTP_THREADS):
     server_address = ('', port)
     logger.info(f"{'═'*60}")
     logger.info(f"🧬 LAZARUS BACKEND v11.0 — DETAILED LOGGING ENABLED")
     logger.info(f"{'═'*60}")
     logger.info(f"   Port:      {port}")
+    logger.info(f"   Workers:   {http_threads} HTTP threads, {JOB_WORKERS} job workers")
     logger.info(f"   Debug Logs: http://localhost:{port}/api/debug-logs")
-    logger.info(f"   Endpoints:  /api/scan, /api/analyze, /api/resurrect, /api/commit, /api/create-pr")
+    logger.info(f"   Endpoints:  /api/scan, /api/analyze, /api/resurrect, /api/commit, /api/create-pr, /api/cache/clear")
     logger.info(f"{'═'*60}")
     add_debug_log('INFO', 'SERVER', 'Lazarus backend started', {'port': port})
-    httpd = server_class(server_address, handler_class)
+    httpd = server_class(server_address, handler_class, max_workers=http_threads)
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         logger.info("Server shutting down...")
     httpd.server_close()
+    httpd.shutdown_workers()
+    _JOB_POOL.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Lazarus backend server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--threads-http", type=int, default=HTTP_THREADS,
+                        help="connections handled concurrently (default: $LAZARUS_HTTP_THREADS or a CPU-based guess)")
+    args = parser.parse_args()
+    run(port=args.port, http_threads=max(1, args.threads_http))
@@ -21,6 +21,10 @@ HEADERS = {
 
 BASE_API = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/contents"
 
+# One keep-alive connection for every GET/PUT pair instead of a TLS handshake per call
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+
 # Legacy Codebase Assets
 FILES = {
     "backend/api.py": """
@@ -122,7 +126,7 @@ def upload_file(path, content):
     
     # Check if exists to get SHA
     sha = None
-    resp = requests.get(url, headers=HEADERS)
+    resp = SESSION.get(url)
     if resp.status_code == 200:
         sha = resp.json()['sha']
 
@@ -136,7 +140,7 @@ def upload_file(path, content):
         data['sha'] = sha
 
     print(f"[*] Uploading {path}...")
-    put_resp = requests.put(url, headers=HEADERS, json=data)
+    put_resp = SESSION.put(url, json=data)
     if put_resp.status_code in [200, 201]:
         print(f"    [+] Success")
     else:
@@ -9,6 +9,14 @@ Version 7.0 adds multi-batch processing to handle large repositories
 without exceeding API token limits.
 """
 
+import json
+import hashlib
+import functools
+import itertools
+from typing import Iterator
+
+from ttl_cache import TTLCache
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # BATCH ARCHITECTURE PROMPTS (NEW - v7.0)
@@ -33,14 +41,18 @@ def get_lightweight_plan_prompt(
     file_count = len(file_paths)
     
     # Build concise file tree
-    file_tree = "\n".join([f"  {i+1}. {p}" for i, p in enumerate(file_paths)])
+    file_tree = "\n".join(f"  {i}. {p}" for i, p in enumerate(file_paths, 1))
     
-    # Build endpoint summary
-    endpoint_summary = "\n".join([f"  - {ep}" for ep in api_endpoints[:30]]) if api_endpoints else "  [None detected]"
+    # Build endpoint summary (islice: a large scan can report thousands of endpoints)
+    endpoint_summary = "\n".join(map("  - {}".format, itertools.islice(api_endpoints, 30))) if api_endpoints else "  [None detected]"
     
     # Build preservation summary
-    preserve_summary = "\n".join([f"  - {item}" for item in must_preserve[:20]]) if must_preserve else "  [None]"
-    modernize_summary = "\n".join([f"  - {item}" for item in can_modernize[:20]]) if can_modernize else "  [None]"
+    preserve_summary = "\n".join(map("  - {}".format, itertools.islice(must_preserve, 20))) if must_preserve else "  [None]"
+    modernize_summary = "\n".join(map("  - {}".format, itertools.islice(can_modernize, 20))) if can_modernize else "  [None]"
+    
+    # Resolve the stack fields once (a scan may record a missing side as None)
+    backend_stack = tech_stack.get('backend') or {}
+    frontend_stack = tech_stack.get('frontend') or {}
     
     return f"""
 ╔══════════════════════════════════════════════════════════════════════════════╗
@@ -61,9 +73,9 @@ User Instructions: "{instructions if instructions else 'Modernize UI while prese
 Total Files: {file_count}
 
 DETECTED TECH STACK:
-- Backend Framework: {tech_stack.get('backend', {}).get('framework', 'Unknown')}
-- Database: {tech_stack.get('backend', {}).get('database', 'Unknown')}
-- Frontend Framework: {tech_stack.get('frontend', {}).get('framework', 'Unknown')}
+- Backend Framework: {backend_stack.get('framework', 'Unknown')}
+- Database: {backend_stack.get('database', 'Unknown')}
+- Frontend Framework: {frontend_stack.get('framework', 'Unknown')}
 - Languages: {tech_stack.get('languages', [])}
 
 🔒 MUST PRESERVE:
@@ -123,6 +135,20 @@ Output format: Plain text with clear section headers.
 """
 
 
+# Closing fence after each embedded file's content
+_BATCH_FILE_TRAILER = "\n```\n\n"
+_CODE_FILE_TRAILER = "\n```\n\n⚠️ YOU MUST OUTPUT THIS ENTIRE FILE WITH SAME FUNCTIONALITY!\n"
+
+
+@functools.lru_cache(maxsize=4)
+def _format_path_list(paths: tuple) -> str:
+    """
+    Cross-reference manifest for batch prompts. It is the same for every batch of a
+    run, so it is built once (pass a tuple to avoid a conversion per batch).
+    """
+    return "\n".join([f"  - {p}" for p in paths])
+
+
 def get_batch_code_generation_prompt(
     plan: str,
     batch_files: list,
@@ -133,9 +159,28 @@ def get_batch_code_generation_prompt(
     previously_generated_summaries: str,
     memory_context: str = "",
 ) -> str:
+    """Assemble the per-batch prompt from iter_batch_code_generation_prompt in a single join."""
+    return "".join(iter_batch_code_generation_prompt(
+        plan, batch_files, batch_index, total_batches, batch_name,
+        all_file_paths, previously_generated_summaries, memory_context,
+    ))
+
+
+def iter_batch_code_generation_prompt(
+    plan: str,
+    batch_files: list,
+    batch_index: int,
+    total_batches: int,
+    batch_name: str,
+    all_file_paths: list,
+    previously_generated_summaries: str,
+    memory_context: str = "",
+) -> Iterator[str]:
     """
-    Per-batch code generation prompt. Only includes the FULL contents
-    of files in THIS batch, plus summaries from previous batches.
+    Per-batch code generation prompt, yielded section by section. Only includes the
+    FULL contents of files in THIS batch (one section per file), plus summaries
+    from previous batches. The run-wide context (memory, plan, manifest) comes
+    first so every batch of a run shares the same prompt prefix.
     
     Args:
         plan: The overall modernization plan
@@ -149,41 +194,27 @@ def get_batch_code_generation_prompt(
     """
     batch_count = len(batch_files)
     
-    # Build the file contents for THIS batch only
-    batch_code_context = ""
-    for f in batch_files:
-        batch_code_context += f"""
-████████████████████████████████████████████████████████████████████████████████
-█ ORIGINAL FILE: {f['path']}
-█ COPY THIS FILE COMPLETELY, ONLY ENHANCE STYLING
-████████████████████████████████████████████████████████████████████████████████
-
-```{f.get('language', 'text')}
-{f['content']}
-```
-
-"""
+    # File contents for THIS batch only, produced lazily; a one-line header per file (the
+    # banners stay on the section dividers only). The content is yielded as its own
+    # piece, so each file is copied once, by the final join, not into a block first.
+    file_blocks = itertools.chain.from_iterable((
+        f"\n--- ORIGINAL FILE: {f['path']} (COPY THIS FILE COMPLETELY, ONLY ENHANCE STYLING) ---\n```{f.get('language', 'text')}\n",
+        f['content'],
+        _BATCH_FILE_TRAILER,
+    ) for f in batch_files)
     
     # Build full file manifest (paths only, for cross-reference)
-    all_paths_list = "\n".join([f"  - {p}" for p in all_file_paths])
+    all_paths_list = _format_path_list(tuple(all_file_paths))
     
-    return f"""
+    # Run-wide context first: it is identical for every batch of a run, so the
+    # provider's implicit prefix cache can reuse it across the batch calls
+    yield f"""
 ████████████████████████████████████████████████████████████████████████████████
 █  LAZARUS ENGINE - BATCH CODE GENERATION                                      █
-█  BATCH {batch_index + 1} OF {total_batches}: {batch_name}                    █
-█  FILES IN THIS BATCH: {batch_count}                                          █
 ████████████████████████████████████████████████████████████████████████████████
 
 {memory_context if memory_context else ""}
 
-🚨 CRITICAL INSTRUCTION:
-You are generating ENHANCED versions of {batch_count} files.
-This is batch {batch_index + 1} of {total_batches} total batches.
-Other batches handle the remaining files - DO NOT generate files outside this batch.
-
-THE GOLDEN RULE:
-"COPY EVERYTHING. CHANGE ONLY HOW IT LOOKS, NOT WHAT IT DOES."
-
 ═══════════════════════════════════════════════════════════════════════════════
 OVERALL ENHANCEMENT PLAN:
 ═══════════════════════════════════════════════════════════════════════════════
@@ -195,6 +226,21 @@ ALL FILES IN THE REPOSITORY (for cross-reference):
 ═══════════════════════════════════════════════════════════════════════════════
 {all_paths_list}
 
+"""
+    yield f"""
+████████████████████████████████████████████████████████████████████████████████
+█  BATCH {batch_index + 1} OF {total_batches}: {batch_name}                    █
+█  FILES IN THIS BATCH: {batch_count}                                          █
+████████████████████████████████████████████████████████████████████████████████
+
+🚨 CRITICAL INSTRUCTION:
+You are generating ENHANCED versions of {batch_count} files.
+This is batch {batch_index + 1} of {total_batches} total batches.
+Other batches handle the remaining files - DO NOT generate files outside this batch.
+
+THE GOLDEN RULE:
+"COPY EVERYTHING. CHANGE ONLY HOW IT LOOKS, NOT WHAT IT DOES."
+
 ═══════════════════════════════════════════════════════════════════════════════
 CONTEXT FROM PREVIOUSLY GENERATED BATCHES:
 ═══════════════════════════════════════════════════════════════════════════════
@@ -204,7 +250,9 @@ CONTEXT FROM PREVIOUSLY GENERATED BATCHES:
 FILES TO GENERATE IN THIS BATCH ({batch_count} files):
 ═══════════════════════════════════════════════════════════════════════════════
 
-{batch_code_context}
+"""
+    yield from file_blocks
+    yield f"""
 
 ═══════════════════════════════════════════════════════════════════════════════
 OUTPUT FORMAT:
@@ -238,7 +286,7 @@ SERVER FILE RULES (if this batch contains server files):
   * DO NOT serve static files (no app.static(), StaticFiles, send_file, etc.)
   * DO NOT return HTML responses (only JSON)
   * Frontend files (index.html, .css, .js) should be separate
-  * All API endpoints should return JSON: {"status": "ok", "data": [...]}
+  * All API endpoints should return JSON: {{"status": "ok", "data": [...]}}
 - **CORS CONFIGURATION**: Enable CORS for all origins
   * FastAPI: app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
   * Flask: CORS(app, resources={{r"/*": {{"origins": "*"}}}})
@@ -342,6 +390,22 @@ NOW GENERATE ALL {batch_count} ENHANCED FILES FOR THIS BATCH
 """
 
 
+# Line prefixes worth carrying into the cross-batch summary (exports, definitions,
+# route registrations, imports); a tuple so each line costs one str.startswith call
+_SIG_PREFIXES = (
+    'export ', 'module.exports', 'exports.',
+    'function ', 'const ', 'class ',
+    'app.get(', 'app.post(', 'app.put(', 'app.delete(', 'app.patch(',
+    'router.get(', 'router.post(', 'router.put(', 'router.delete(',
+    'def ',  # Python
+    '@app.route', '@router.',  # Flask/FastAPI
+    'import ', 'from ', 'require(',  # Imports, for dependency tracking ('const {' is covered by 'const ')
+)
+
+# Signature lines kept per file in a cross-batch summary
+SUMMARY_MAX_KEY_LINES = 30
+
+
 def extract_batch_summary(generated_files: list) -> str:
     """
     Extracts a brief summary of generated files for cross-batch context.
@@ -355,24 +419,17 @@ def extract_batch_summary(generated_files: list) -> str:
         
         # Extract key signatures (not full content)
         key_lines = []
-        for line in content.split('\n'):
+        for line in content.splitlines():
             stripped = line.strip()
-            # JavaScript/TypeScript exports and definitions
-            if any(stripped.startswith(kw) for kw in [
-                'export ', 'module.exports', 'exports.',
-                'function ', 'const ', 'class ',
-                'app.get(', 'app.post(', 'app.put(', 'app.delete(', 'app.patch(',
-                'router.get(', 'router.post(', 'router.put(', 'router.delete(',
-                'def ', 'class ',  # Python
-                '@app.route', '@router.',  # Flask/FastAPI
-            ]):
+            # Exports, definitions, routes and imports
+            if stripped.startswith(_SIG_PREFIXES):
                 key_lines.append(stripped[:120])  # Truncate long lines
-            # Also grab import lines for dependency tracking
-            if stripped.startswith(('import ', 'from ', 'require(', 'const {', 'const {')):
-                key_lines.append(stripped[:120])
+                # Only the first SUMMARY_MAX_KEY_LINES are kept, so stop scanning there
+                if len(key_lines) == SUMMARY_MAX_KEY_LINES:
+                    break
         
         if key_lines:
-            summary = f"\n--- {path} ---\n" + "\n".join(key_lines[:30])  # Max 30 key lines
+            summary = f"\n--- {path} ---\n" + "\n".join(key_lines)
             summaries.append(summary)
         else:
             summaries.append(f"\n--- {path} --- [config/static file]")
@@ -384,11 +441,81 @@ def extract_batch_summary(generated_files: list) -> str:
 # ORIGINAL SINGLE-SHOT PROMPT (FALLBACK for small repos < 10 files)
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Files the model is never asked to round-trip: lockfiles are rewritten by the package
+# manager and minified bundles are build output. The PR is built on the original tree,
+# so they stay in the repository untouched.
+PROMPT_EXCLUDED_NAMES = frozenset({
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'npm-shrinkwrap.json',
+    'Pipfile.lock', 'poetry.lock', 'Gemfile.lock', 'composer.lock', 'Cargo.lock',
+})
+PROMPT_EXCLUDED_SUFFIXES = ('.lock', '.min.js', '.min.mjs', '.min.css')
+# Single files above this many characters are treated as generated/vendored
+PROMPT_MAX_FILE_CHARS = 200_000
+
+
+def split_prompt_files(files: list) -> tuple:
+    """Split deep-scan files into (embedded in the prompt, kept from the original)."""
+    embedded, excluded = [], []
+    for f in files:
+        path = f['path']
+        name = path.rsplit('/', 1)[-1]
+        if (name in PROMPT_EXCLUDED_NAMES or name.endswith(PROMPT_EXCLUDED_SUFFIXES)
+                or len(f.get('content', '')) > PROMPT_MAX_FILE_CHARS):
+            excluded.append(f)
+        else:
+            embedded.append(f)
+    return embedded, excluded
+
+
+# Built code-generation prompts, keyed on (plan, _scan_digest(scan), memory_context).
+# A re-run resurrection on an unchanged repo reuses the prompt instead of rebuilding it.
+_CODE_PROMPT_CACHE = TTLCache(maxsize=8, ttl=3600)
+
+
+def _scan_digest(deep_scan_result: dict) -> bytes:
+    """Digest of exactly the deep-scan fields the code-generation prompt reads."""
+    h = hashlib.blake2b(digest_size=16)
+    if deep_scan_result:
+        for f in deep_scan_result.get("files", []):
+            for part in (f['path'], f['language'], f['content']):
+                h.update(str(part).encode('utf-8', 'surrogatepass'))
+                h.update(b'\0')
+        h.update(json.dumps(deep_scan_result.get("api_endpoints", []), default=str).encode('utf-8'))
+        database = deep_scan_result.get("tech_stack", {}).get('backend', {}).get('database', 'Unknown')
+        h.update(str(database).encode('utf-8'))
+    return h.digest()
+
+
 def get_code_generation_prompt(plan: str, deep_scan_result: dict = None, memory_context: str = "") -> str:
     """
-    Returns the ABSOLUTE PRESERVATION code generation prompt.
+    Returns the ABSOLUTE PRESERVATION code generation prompt (memoized, see _CODE_PROMPT_CACHE).
+    
+    Args:
+        plan: The modernization plan
+        deep_scan_result: Results from deep scanning the repository
+        memory_context: Past resurrection memory for this repository
+    """
+    key = (plan, _scan_digest(deep_scan_result), memory_context or "")
+    prompt = _CODE_PROMPT_CACHE.get(key)
+    if prompt is None:
+        prompt = _build_code_generation_prompt(plan, deep_scan_result, memory_context)
+        _CODE_PROMPT_CACHE.set(key, prompt)
+    return prompt
+
+
+def _build_code_generation_prompt(plan: str, deep_scan_result: dict = None, memory_context: str = "") -> str:
+    """Assemble the full prompt from iter_code_generation_prompt in a single join."""
+    return "".join(iter_code_generation_prompt(plan, deep_scan_result, memory_context))
+
+
+def iter_code_generation_prompt(plan: str, deep_scan_result: dict = None, memory_context: str = "") -> Iterator[str]:
+    """
+    Yields the ABSOLUTE PRESERVATION code generation prompt section by section.
     Key principle: COPY every line of code, only enhance CSS/styling.
     
+    Each original file is its own section, so the repository's source is never
+    copied into an intermediate context string on its way into the prompt.
+    
     Args:
         plan: The modernization plan
         deep_scan_result: Results from deep scanning the repository
@@ -397,42 +524,38 @@ def get_code_generation_prompt(plan: str, deep_scan_result: dict = None, memory_
     
     # Build list of ALL files that MUST be output
     file_list = ""
-    existing_code_context = ""
+    file_blocks = ()
     total_files = 0
     total_endpoints = 0
     
     if deep_scan_result:
-        files = deep_scan_result.get("files", [])
-        tech_stack = deep_scan_result.get("tech_stack", {})
-        must_preserve = deep_scan_result.get("must_preserve", [])
+        files, kept_files = split_prompt_files(deep_scan_result.get("files", []))
+        db_type = deep_scan_result.get("tech_stack", {}).get('backend', {}).get('database', 'Unknown')
         api_endpoints = deep_scan_result.get("api_endpoints", [])
         total_files = len(files)
         total_endpoints = len(api_endpoints)
         
         # Build MANDATORY file list - ALL files must be output!
-        file_list = ""
-        for i, f in enumerate(files, 1):
-            file_list += f"  {i}. {f['path']}\n"
+        # (each section is joined once; += on a growing prompt re-copies it per file)
+        file_list = "".join(f"  {i}. {f['path']}\n" for i, f in enumerate(files, 1))
         
-        # Build file contents - COMPLETE, NO TRUNCATION
-        for f in files:
-            existing_code_context += f"""
-████████████████████████████████████████████████████████████████████████████████
-█ ORIGINAL FILE #{files.index(f) + 1}: {f['path']}
-█ COPY THIS FILE COMPLETELY, ONLY ENHANCE STYLING
-████████████████████████████████████████████████████████████████████████████████
-
-```{f['language']}
-{f['content']}
-```
-
-⚠️ YOU MUST OUTPUT THIS ENTIRE FILE WITH SAME FUNCTIONALITY!
-"""
+        # Build file contents - COMPLETE, NO TRUNCATION (lazily; header, content and
+        # trailer are separate pieces so each file is copied only by the final join)
+        file_blocks = itertools.chain.from_iterable((
+            f"\n--- ORIGINAL FILE #{i}: {f['path']} (COPY THIS FILE COMPLETELY, ONLY ENHANCE STYLING) ---\n```{f['language']}\n",
+            f['content'],
+            _CODE_FILE_TRAILER,
+        ) for i, f in enumerate(files, 1))
+        file_blocks = itertools.chain(file_blocks, ("\n",))  # blank line closing the section
         
         # Build endpoint list
-        endpoint_list = ""
-        for i, ep in enumerate(api_endpoints, 1):
-            endpoint_list += f"  {i}. {ep}\n"
+        endpoint_list = "".join(f"  {i}. {ep}\n" for i, ep in enumerate(api_endpoints, 1))
+        
+        # Lockfiles, minified bundles and huge files are named but not shown
+        kept_section = ""
+        if kept_files:
+            kept_section = "\nFILES KEPT FROM THE ORIGINAL (NOT SHOWN - DO NOT OUTPUT THESE):\n" + "".join(
+                f"  - {f['path']}\n" for f in kept_files)
         
         preservation_rules = f"""
 
@@ -448,18 +571,17 @@ def get_code_generation_prompt(plan: str, deep_scan_result: dict = None, memory_
 ⚠️ YOU MUST PRESERVE ALL {total_endpoints} API ENDPOINTS!
 
 FILES YOU MUST OUTPUT (EVERY SINGLE ONE):
-{file_list}
+{file_list}{kept_section}
 
 API ENDPOINTS YOU MUST PRESERVE (EVERY SINGLE ONE):
 {endpoint_list if endpoint_list else "  [Detect from server files and preserve all]"}
 
-DATABASE: {tech_stack.get('backend', {}).get('database', 'Unknown')}
+DATABASE: {db_type}
 >> KEEP THE SAME DATABASE! COPY THE EXACT CONNECTION CODE! <<
 
 ████████████████████████████████████████████████████████████████████████████████
 █ ALL ORIGINAL FILES (COPY EACH ONE COMPLETELY):
 ████████████████████████████████████████████████████████████████████████████████
-{existing_code_context}
 """
     else:
         preservation_rules = """
@@ -467,7 +589,7 @@ DATABASE: {tech_stack.get('backend', {}).get('database', 'Unknown')}
 """
         total_files = 0
     
-    return f"""
+    yield f"""
 ████████████████████████████████████████████████████████████████████████████████
 █  LAZARUS ENGINE - ABSOLUTE PRESERVATION MODE                                █
 █  VERSION: 6.0 - COPY EVERYTHING, ENHANCE APPEARANCE ONLY                   █
@@ -526,7 +648,10 @@ SECTION 1: MODERNIZATION PLAN
 
 {plan}
 
-{preservation_rules}
+"""
+    yield preservation_rules
+    yield from file_blocks
+    yield f"""
 
 ═══════════════════════════════════════════════════════════════════════════════
 SECTION 2: OUTPUT FORMAT
@@ -783,3 +908,86 @@ Output every single file now.
 Copy all functionality.
 Enhance only appearance.
 """
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPOSITORY ANALYSIS PROMPT (/api/analyze)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Static response schema, built once at import; only the detected-stack header varies per request
+ANALYSIS_RESPONSE_FORMAT = """Respond in this EXACT JSON format (no markdown, no code blocks, just raw JSON):
+{
+  "summary": "A 3-4 sentence narrative explaining what this project does, how it's structured, and what its purpose is. Write it like you're explaining the project to someone who has never seen it.",
+  "health_score": 65,
+  "project_understanding": {
+    "purpose": "What the project is built for (1-2 sentences)",
+    "architecture": "How the codebase is organized (1-2 sentences)",
+    "data_flow": "How data moves through the system (1-2 sentences)"
+  },
+  "drawbacks": [
+    {
+      "id": "d1",
+      "title": "Short title of the issue",
+      "description": "Detailed explanation of why this is a problem",
+      "severity": "critical",
+      "category": "security"
+    }
+  ],
+  "workflow_table": [
+    {
+      "phase": "Phase 1 - Analysis",
+      "task": "Task name",
+      "description": "What this task involves",
+      "duration": "2 hours",
+      "dependencies": "None",
+      "status": "complete"
+    }
+  ],
+  "recommendations": [
+    {
+      "category": "Backend",
+      "current": "Current tech",
+      "recommended": "New tech",
+      "reason": "Why upgrade",
+      "priority": "high",
+      "effort": "medium"
+    }
+  ],
+  "workflow_steps": [
+    {
+      "step": 1,
+      "title": "Step title",
+      "description": "What happens in this step",
+      "status": "pending"
+    }
+  ],
+  "risks": ["Risk 1", "Risk 2"],
+  "estimated_impact": "Impact description"
+}"""
+
+
+def get_analysis_prompt(
+    current_stack: dict,
+    api_endpoints: list,
+    db_schemas: list,
+    must_preserve: list,
+    can_modernize: list,
+) -> str:
+    """Modernization-analysis prompt for a deep-scanned repository."""
+    return f"""Analyze this legacy repository tech stack and provide a comprehensive project understanding and modernization plan.
+
+CURRENT TECH STACK DETECTED:
+- Backend Framework: {current_stack['backend_framework']}
+- Database: {current_stack['database']}
+- Authentication: {current_stack['auth']}
+- Frontend Framework: {current_stack['frontend_framework']}
+- Frontend Styling: {current_stack['frontend_styling']}
+- Total Files: {current_stack['total_files']}
+- API Endpoints Found: {len(api_endpoints)}
+- Database Schemas: {len(db_schemas)}
+
+API ENDPOINTS: {json.dumps(api_endpoints[:10])}
+MUST PRESERVE: {json.dumps(must_preserve[:10])}
+CAN MODERNIZE: {json.dumps(can_modernize[:10])}
+
+{ANALYSIS_RESPONSE_FORMAT}"""
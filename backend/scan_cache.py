@@ -0,0 +1,151 @@
+"""
+Lazarus Engine - Persistent Scan Cache
+Deep-scan results keyed by commit SHA
+
+A deep scan fetches every code file in the repository, so re-running it for
+an unchanged HEAD is pure waste. Results are stored in a small SQLite
+database (WAL mode, safe across handler threads) keyed by
+owner/repo@sha:kind and a cache version that is bumped whenever the scan or
+analysis logic changes shape.
+
+File contents for the viewer are stored by git blob SHA: a blob SHA names
+exact bytes, so those entries never go stale. Only text that decoded as
+UTF-8 without loss is stored.
+
+Gemini responses (analysis, modernization plans, generated code) are stored
+by a SHA-256 of the prompt and expire after LLM_CACHE_TTL seconds.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+# Bump when scan_repository_deep's result shape or analysis rules change
+SCAN_CACHE_VERSION = 2
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "scan_cache.db")
+
+# Age after which a cached Gemini response is ignored
+LLM_CACHE_TTL = 24 * 3600
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Open (once) the shared connection and make sure the table exists."""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL skips the fsync per commit; the worst case after a power loss is
+        # losing the last few cache writes, which just get fetched again
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_cache ("
+            "key TEXT PRIMARY KEY, kind TEXT, sha TEXT, payload BLOB, created INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_cache (blob_sha TEXT PRIMARY KEY, content BLOB)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (prompt_sha BLOB PRIMARY KEY, response TEXT, created INTEGER)"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def make_key(owner: str, repo_name: str, sha: str, kind: str) -> str:
+    """Cache key for one scan of a repository at a specific commit."""
+    return f"v{SCAN_CACHE_VERSION}:{owner}/{repo_name}@{sha}:{kind}".lower()
+
+
+def get_cached_scan(key: str) -> Optional[dict]:
+    """Return the cached payload for key, or None on a miss or unreadable entry."""
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT payload FROM scan_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+    except (sqlite3.Error, ValueError) as e:
+        print(f"[!] Scan cache read failed: {e}")
+        return None
+
+
+def put_cached_scan(key: str, kind: str, sha: str, payload: dict):
+    """Store a scan result; failures are logged and ignored (the cache is optional)."""
+    try:
+        blob = json.dumps(payload).encode("utf-8")
+        with _lock:
+            conn = _get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_cache (key, kind, sha, payload, created) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, sha, blob, int(time.time())),
+            )
+            conn.commit()
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        print(f"[!] Scan cache write failed: {e}")
+
+
+def get_cached_file(blob_sha: str) -> Optional[str]:
+    """Return the text stored for a git blob SHA, or None."""
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT content FROM file_cache WHERE blob_sha = ?", (blob_sha,)
+            ).fetchone()
+        return row[0].decode("utf-8") if row else None
+    except (sqlite3.Error, UnicodeDecodeError) as e:
+        print(f"[!] File cache read failed: {e}")
+        return None
+
+
+def put_cached_file(blob_sha: str, content: str):
+    """Store the text for a git blob SHA."""
+    try:
+        with _lock:
+            conn = _get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO file_cache (blob_sha, content) VALUES (?, ?)",
+                (blob_sha, content.encode("utf-8")),
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"[!] File cache write failed: {e}")
+
+
+def get_cached_llm(prompt_sha: bytes) -> Optional[str]:
+    """Return a Gemini response cached for this prompt digest within LLM_CACHE_TTL, or None."""
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT response FROM llm_cache WHERE prompt_sha = ? AND created > ?",
+                (prompt_sha, int(time.time()) - LLM_CACHE_TTL),
+            ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"[!] LLM cache read failed: {e}")
+        return None
+
+
+def put_cached_llm(prompt_sha: bytes, response: str):
+    """Store a Gemini response for a prompt digest, dropping expired ones (generated code is large)."""
+    try:
+        now = int(time.time())
+        with _lock:
+            conn = _get_conn()
+            conn.execute("DELETE FROM llm_cache WHERE created <= ?", (now - LLM_CACHE_TTL,))
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (prompt_sha, response, created) VALUES (?, ?, ?)",
+                (prompt_sha, response, now),
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"[!] LLM cache write failed: {e}")
@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
 key = os.getenv('GEMINI_API_KEY')
 print(f'Key present: {bool(key)}')
@@ -13,13 +14,24 @@ models_to_test = [
     'gemini-1.5-flash',
 ]
 
-for model in models_to_test:
+# One shared session (requests.post builds and tears down a new one per call), so
+# connections are pooled; json= already sends Content-Type: application/json
+session = requests.Session()
+
+def probe(model):
+    """Call one model and return its report lines (probes run concurrently)."""
     url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}'
     try:
-        resp = requests.post(url, json={'contents':[{'parts':[{'text':'Say hello in 5 words'}]}]}, headers={'Content-Type':'application/json'}, timeout=10)
-        print(f'{model}: {resp.status_code}')
+        resp = session.post(url, json={'contents':[{'parts':[{'text':'Say hello in 5 words'}]}]}, timeout=10)
+        lines = [f'{model}: {resp.status_code}']
         if resp.status_code == 200:
             text = resp.json()['candidates'][0]['content']['parts'][0]['text']
-            print(f'  -> {text[:80]}')
+            lines.append(f'  -> {text[:80]}')
+        return lines
     except Exception as e:
-        print(f'{model}: ERROR - {e}')
+        return [f'{model}: ERROR - {e}']
+
+# map() yields in submission order, so the report reads the same as the serial loop
+with ThreadPoolExecutor(max_workers=len(models_to_test)) as pool:
+    for lines in pool.map(probe, models_to_test):
+        print('\n'.join(lines))
@@ -0,0 +1,61 @@
+"""
+Lazarus Engine - In-Process TTL Cache
+Short-lived cache for GitHub read responses
+
+Entries expire after `ttl` seconds but are kept (up to `maxsize`, LRU order)
+so a stale entry's ETag can still be used for an If-None-Match revalidation.
+A 304 from GitHub is instant and does not count against the rate limit.
+"""
+
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+# value: cached payload, etag: GitHub ETag (or None), fresh: still inside the TTL
+CacheEntry = namedtuple("CacheEntry", ["value", "etag", "fresh"])
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and ETag storage."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value, etag)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value if it is still fresh, else None."""
+        entry = self.get_entry(key)
+        if entry and entry.fresh:
+            return entry.value
+        return None
+
+    def get_entry(self, key):
+        """Return a CacheEntry for key (fresh or stale), or None if absent."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            expires_at, value, etag = item
+            return CacheEntry(value, etag, time.monotonic() < expires_at)
+
+    def set(self, key, value, etag: str = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value, etag)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def touch(self, key):
+        """Restart the TTL of an existing entry (after a 304 revalidation)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data[key] = (time.monotonic() + self.ttl, item[1], item[2])
+                self._data.move_to_end(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()